@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+import asyncio
+import os
+import time
+
+from baseten_backend_take_home.models import PRIORITIES, normalize_priority
+from baseten_backend_take_home.prometheus_metrics import (
+    UPSTREAM_DISPATCHED,
+    UPSTREAM_DISPATCH_IN_FLIGHT,
+    UPSTREAM_DISPATCH_QUEUE_DEPTH,
+    UPSTREAM_DISPATCH_WAIT,
+)
+
+# Upstream calls in flight at once, defaults to the connection pool size
+# so calls queue here by priority rather than FIFO inside aiohttp
+UPSTREAM_MAX_CONCURRENCY = int(
+    os.getenv(
+        "UPSTREAM_MAX_CONCURRENCY", os.getenv("UPSTREAM_POOL_SIZE", "100")
+    )
+)
+# Slots only the high lane may use
+PRIORITY_HIGH_RESERVED = int(os.getenv("PRIORITY_HIGH_RESERVED", "20"))
+# Head start of each lane over the next one: a low call that has waited
+# this long goes before high calls that just arrived
+PRIORITY_AGING_SECONDS = float(os.getenv("PRIORITY_AGING_SECONDS", "1.0"))
+# Priority of calls without a header or an organization default, checked
+# here so a typo fails startup rather than every invocation
+DEFAULT_PRIORITY = normalize_priority(
+    os.getenv("DEFAULT_PRIORITY", PRIORITIES[0]), "DEFAULT_PRIORITY"
+)
+
+
+class _Waiter:
+    __slots__ = ("deadline", "enqueued", "future")
+
+    def __init__(self, deadline: float, enqueued: float):
+        self.deadline = deadline
+        self.enqueued = enqueued
+        self.future: asyncio.Future = (
+            asyncio.get_running_loop().create_future()
+        )
+
+
+class _Lane:
+    """FIFO of waiting calls of one priority, with pre-bound metrics."""
+
+    def __init__(self, name: str, penalty: float, limit: int):
+        self.name = name
+        self.penalty = penalty
+        self.limit = limit
+        self.in_flight = 0
+        self.waiters: Deque[_Waiter] = deque()
+        self.wait_metric = UPSTREAM_DISPATCH_WAIT.labels(lane=name)
+        self.dispatched_metric = UPSTREAM_DISPATCHED.labels(lane=name)
+        self.depth_metric = UPSTREAM_DISPATCH_QUEUE_DEPTH.labels(lane=name)
+        self.in_flight_metric = UPSTREAM_DISPATCH_IN_FLIGHT.labels(lane=name)
+
+    @property
+    def eligible(self) -> bool:
+        return bool(self.waiters) and self.in_flight < self.limit
+
+
+class PriorityDispatcher:
+    """
+    Admits upstream calls by priority lane.
+
+    At most capacity calls hold a slot at once. Every lane but the first
+    may only fill capacity - reserved slots, so high priority calls find a
+    free slot even while bulk traffic saturates the rest.
+
+    Waiting calls are ordered by arrival time plus their lane's aging
+    penalty. A high call goes first unless a low call has been waiting
+    aging seconds longer, so low priority never starves. The penalty is
+    fixed per lane, so every lane stays a plain FIFO and picking the next
+    call only compares lane heads.
+    """
+
+    def __init__(
+        self,
+        capacity: int = UPSTREAM_MAX_CONCURRENCY,
+        reserved: int = PRIORITY_HIGH_RESERVED,
+        aging: float = PRIORITY_AGING_SECONDS,
+    ):
+        self.capacity = capacity
+        self.in_flight = 0
+        # The other lanes keep at least one slot, whatever is reserved
+        shared = max(1, capacity - reserved)
+        self._lanes: Dict[str, _Lane] = {
+            name: _Lane(name, i * aging, capacity if i == 0 else shared)
+            for i, name in enumerate(PRIORITIES)
+        }
+
+    async def acquire(self, priority: str) -> None:
+        """Wait for a slot in a priority lane"""
+        lane = self._lanes[priority]
+        now = time.perf_counter()
+        waiter = _Waiter(now + lane.penalty, now)
+        lane.waiters.append(waiter)
+        lane.depth_metric.inc()
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if not waiter.future.cancelled():
+                # Granted just as the caller was cancelled
+                self.release(priority)
+            elif waiter in lane.waiters:
+                # Still queued, give up the place in line
+                lane.waiters.remove(waiter)
+                lane.depth_metric.dec()
+            raise
+
+    def release(self, priority: str) -> None:
+        """Give a slot back and hand it to the next waiting call"""
+        lane = self._lanes[priority]
+        lane.in_flight -= 1
+        lane.in_flight_metric.dec()
+        self.in_flight -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: str):
+        """Hold a slot in a priority lane for the enclosed block"""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def _dispatch(self) -> None:
+        while self.in_flight < self.capacity:
+            lane = None
+            for candidate in self._lanes.values():
+                if candidate.eligible and (
+                    lane is None
+                    or candidate.waiters[0].deadline < lane.waiters[0].deadline
+                ):
+                    lane = candidate
+            if lane is None:
+                return
+
+            waiter = lane.waiters.popleft()
+            lane.depth_metric.dec()
+            if waiter.future.done():
+                # Cancelled, its caller has not run yet to dequeue it
+                continue
+            lane.in_flight += 1
+            lane.in_flight_metric.inc()
+            self.in_flight += 1
+            lane.wait_metric.observe(time.perf_counter() - waiter.enqueued)
+            lane.dispatched_metric.inc()
+            waiter.future.set_result(None)
+
+
+# Global dispatcher in front of upstream calls
+upstream_dispatcher = PriorityDispatcher()
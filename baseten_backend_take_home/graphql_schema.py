@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+from typing import List, Optional
+
+import strawberry
+
+from baseten_backend_take_home.models import normalize_priority
+from baseten_backend_take_home.repositories import (
+    organization_repository,
+    model_repository,
+)
+from baseten_backend_take_home.negative_cache import negative_cache
+from baseten_backend_take_home.persistence import state_snapshotter
+
+
+#################
+# GRAPHQL API
+# This is just a basic boilerplate to setup a graphql api backed by strawberry
+# see: https://strawberry.rocks/docs for docs
+#################
+@strawberry.type
+class Model:
+    id: int
+    name: str
+    splittable: bool
+
+
+@strawberry.input
+class ModelInput:
+    name: str
+    splittable: bool = False
+
+
+@strawberry.type
+class Organization:
+    id: str
+    name: str
+    models: List[Model]
+    default_priority: Optional[str]
+
+
+@strawberry.type
+class Query:
+    @strawberry.field
+    async def organizations(self) -> List[Organization]:
+        orgs = organization_repository.get_all()
+        return [
+            Organization(
+                id=org.id,
+                name=org.name,
+                models=[
+                    Model(
+                        id=model.id,
+                        name=model.name,
+                        splittable=model.splittable,
+                    )
+                    for model in org.models
+                ],
+                default_priority=org.default_priority,
+            )
+            for org in orgs
+        ]
+
+    @strawberry.field
+    async def organization(self, id: str) -> Optional[Organization]:
+        org = organization_repository.get_by_id(id)
+        if org:
+            return Organization(
+                id=org.id,
+                name=org.name,
+                models=[
+                    Model(
+                        id=model.id,
+                        name=model.name,
+                        splittable=model.splittable,
+                    )
+                    for model in org.models
+                ],
+                default_priority=org.default_priority,
+            )
+        return None
+
+    @strawberry.field
+    async def models(self) -> List[Model]:
+        models = model_repository.get_all()
+        return [
+            Model(id=model.id, name=model.name, splittable=model.splittable)
+            for model in models
+        ]
+
+    @strawberry.field
+    async def model(self, id: int) -> Optional[Model]:
+        model = model_repository.get_by_id(id)
+        if model:
+            return Model(
+                id=model.id, name=model.name, splittable=model.splittable
+            )
+        return None
+
+
+# Every mutation first waits out a running snapshot hydration, which
+# replaces the registry wholesale
+@strawberry.type
+class Mutation:
+    @strawberry.mutation
+    async def create_organization(
+        self, name: str, default_priority: Optional[str] = None
+    ) -> Organization:
+        await state_snapshotter.writable.wait()
+        org = organization_repository.create(
+            name, normalize_priority(default_priority)
+        )
+        return Organization(
+            id=org.id,
+            name=org.name,
+            models=[
+                Model(
+                    id=model.id,
+                    name=model.name,
+                    splittable=model.splittable,
+                )
+                for model in org.models
+            ],
+            default_priority=org.default_priority,
+        )
+
+    @strawberry.mutation
+    async def set_organization_priority(
+        self, organization_id: str, priority: Optional[str]
+    ) -> bool:
+        """Set or clear (null) the default priority of an organization"""
+        await state_snapshotter.writable.wait()
+        org = organization_repository.set_default_priority(
+            organization_id, normalize_priority(priority)
+        )
+        return org is not None
+
+    @strawberry.mutation
+    async def create_model(self, name: str, splittable: bool = False) -> Model:
+        await state_snapshotter.writable.wait()
+        model = model_repository.create(name, splittable=splittable)
+        # A new model may satisfy ids remembered as missing
+        negative_cache.invalidate()
+        return Model(id=model.id, name=model.name, splittable=model.splittable)
+
+    @strawberry.mutation
+    async def add_model_to_organization(
+        self, organization_id: str, model_id: int
+    ) -> bool:
+        await state_snapshotter.writable.wait()
+        model = model_repository.get_by_id(model_id)
+        if model:
+            return organization_repository.add_model_to_organization(
+                organization_id, model
+            )
+        return False
+
+    # Bulk mutations check everything before changing anything and never
+    # await in between, so other requests see all of a call or none of it
+
+    @strawberry.mutation
+    async def create_models(
+        self, models: List[ModelInput], organization_id: Optional[str] = None
+    ) -> List[Model]:
+        """Create models, optionally attached to an organization"""
+        await state_snapshotter.writable.wait()
+        if (
+            organization_id is not None
+            and organization_repository.get_by_id(organization_id) is None
+        ):
+            raise ValueError(f"Organization {organization_id} does not exist")
+        created = model_repository.create_many(
+            (model.name, model.splittable) for model in models
+        )
+        if organization_id is not None:
+            organization_repository.add_models_to_organization(
+                organization_id, created
+            )
+        if created:
+            # New models may satisfy ids remembered as missing
+            negative_cache.invalidate()
+        return [
+            Model(id=model.id, name=model.name, splittable=model.splittable)
+            for model in created
+        ]
+
+    @strawberry.mutation
+    async def add_models_to_organization(
+        self, organization_id: str, model_ids: List[int]
+    ) -> int:
+        """Attach models to an organization, returns how many were new"""
+        await state_snapshotter.writable.wait()
+        models = []
+        missing = []
+        for model_id in model_ids:
+            model = model_repository.get_by_id(model_id)
+            if model is None:
+                missing.append(model_id)
+            else:
+                models.append(model)
+        if missing:
+            raise ValueError(
+                f"{len(missing)} models do not exist: "
+                + ", ".join(str(model_id) for model_id in missing[:10])
+            )
+        added = organization_repository.add_models_to_organization(
+            organization_id, models
+        )
+        if added is None:
+            raise ValueError(f"Organization {organization_id} does not exist")
+        return added
+
+    @strawberry.mutation
+    async def remove_models_from_organization(
+        self, organization_id: str, model_ids: List[int]
+    ) -> int:
+        """Detach models from an organization, returns how many were"""
+        await state_snapshotter.writable.wait()
+        removed = organization_repository.remove_models_from_organization(
+            organization_id, model_ids
+        )
+        if removed is None:
+            raise ValueError(f"Organization {organization_id} does not exist")
+        return removed
+
+    @strawberry.mutation
+    async def remove_model_from_organization(
+        self, organization_id: str, model_id: int
+    ) -> bool:
+        await state_snapshotter.writable.wait()
+        return organization_repository.remove_model_from_organization(
+            organization_id, model_id
+        )
+
+
+SCHEMA = strawberry.Schema(Query, Mutation)
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import heapq
+import itertools
+import os
+import random
+import time
+
+from baseten_backend_take_home.prometheus_metrics import REQUEST_PHASE_LATENCY
+
+# Fraction of requests that get phase timing (0.0 - 1.0). Off by default,
+# sampled responses expose internal timings in Server-Timing
+PHASE_TIMING_SAMPLE_RATE = float(os.getenv("PHASE_TIMING_SAMPLE_RATE", "0"))
+
+# Number of slowest request traces kept for /debug/traces
+PHASE_TIMING_SLOWEST_N = int(os.getenv("PHASE_TIMING_SLOWEST_N", "50"))
+
+# Serve /debug/traces, off by default as it shows other clients' requests
+DEBUG_TRACES_ENABLED = os.getenv("DEBUG_TRACES_ENABLED", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Phases measured outside of the handler itself
+QUEUE_PHASE = "queue"
+RESPOND_PHASE = "respond"
+TOTAL_PHASE = "total"
+
+
+class RequestTrace:
+    """Named phase durations for a single sampled request."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.started_at = time.time()
+        self.phases: Dict[str, int] = {}
+        self._start_ns = time.perf_counter_ns()
+        self._handler_end_ns: Optional[int] = None
+        self.total_ns = 0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Measure the enclosed block as phase `name`"""
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter_ns() - start)
+
+    def add(self, name: str, duration_ns: int) -> None:
+        """Add time to a phase, phases entered twice are summed"""
+        self.phases[name] = self.phases.get(name, 0) + duration_ns
+
+    def begin_handler(self) -> None:
+        """Mark handler entry, the time since arrival is queueing"""
+        self.add(QUEUE_PHASE, time.perf_counter_ns() - self._start_ns)
+
+    def end_handler(self) -> None:
+        """Mark handler exit, the time until headers are sent is respond"""
+        self._handler_end_ns = time.perf_counter_ns()
+
+    def begin_response(self) -> None:
+        """Close the respond phase when response headers go out"""
+        now = time.perf_counter_ns()
+        if self._handler_end_ns is not None:
+            self.add(RESPOND_PHASE, now - self._handler_end_ns)
+        self.total_ns = now - self._start_ns
+
+    def server_timing(self) -> str:
+        """Format phases as a Server-Timing header value"""
+        entries = [
+            f"{name};dur={duration / 1e6:.3f}"
+            for name, duration in self.phases.items()
+        ]
+        entries.append(f"{TOTAL_PHASE};dur={self.total_ns / 1e6:.3f}")
+        return ", ".join(entries)
+
+    def to_dict(self) -> dict:
+        return {
+            "path": self.path,
+            "started_at": self.started_at,
+            "total_ms": self.total_ns / 1e6,
+            "phases_ms": {
+                name: duration / 1e6 for name, duration in self.phases.items()
+            },
+        }
+
+
+class NullTrace:
+    """Stand-in for requests that are not sampled."""
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        yield
+
+    def add(self, name: str, duration_ns: int) -> None:
+        pass
+
+    def begin_handler(self) -> None:
+        pass
+
+    def end_handler(self) -> None:
+        pass
+
+
+NULL_TRACE = NullTrace()
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar(
+    "current_trace", default=None
+)
+
+
+def current_trace():
+    """Get the trace of the request being handled, or a no-op trace"""
+    return _current_trace.get() or NULL_TRACE
+
+
+class SlowestTraces:
+    """Keeps the N slowest request traces."""
+
+    def __init__(self, capacity: int = PHASE_TIMING_SLOWEST_N):
+        self._capacity = capacity
+        self._heap: List[Tuple[int, int, RequestTrace]] = []
+        self._sequence = itertools.count()
+
+    def add(self, trace: RequestTrace) -> None:
+        if self._capacity <= 0:
+            return
+        item = (trace.total_ns, next(self._sequence), trace)
+        if len(self._heap) < self._capacity:
+            heapq.heappush(self._heap, item)
+        elif trace.total_ns > self._heap[0][0]:
+            heapq.heapreplace(self._heap, item)
+
+    def get(self, limit: Optional[int] = None) -> List[RequestTrace]:
+        """Get traces, slowest first"""
+        traces = [t for _, _, t in sorted(self._heap, reverse=True)]
+        return traces[:limit] if limit else traces
+
+    def clear(self) -> None:
+        self._heap.clear()
+
+
+slowest_traces = SlowestTraces()
+
+
+class PhaseTimingMiddleware:
+    """
+    ASGI middleware that traces a sample of requests on given paths.
+
+    Sampled requests get a Server-Timing response header, feed the
+    per-phase histograms and compete for a spot in slowest_traces.
+    """
+
+    def __init__(
+        self,
+        app,
+        paths: Iterable[str] = ("/invoke",),
+        sample_rate: float = PHASE_TIMING_SAMPLE_RATE,
+    ):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["path"] not in self.paths
+            or self.sample_rate <= 0
+            or (self.sample_rate < 1 and random.random() >= self.sample_rate)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(scope["path"])
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                trace.begin_response()
+                headers = list(message.get("headers", []))
+                headers.append(
+                    (b"server-timing", trace.server_timing().encode())
+                )
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            if trace.total_ns:
+                self._observe(trace)
+
+    @staticmethod
+    def _observe(trace: RequestTrace) -> None:
+        for name, duration in trace.phases.items():
+            _phase_histogram(trace.path, name).observe(duration / 1e9)
+        _phase_histogram(trace.path, TOTAL_PHASE).observe(trace.total_ns / 1e9)
+        slowest_traces.add(trace)
+
+
+# Paths are limited to the middleware's configured set and phases to the
+# names used in code, so this stays small
+_phase_children: Dict[Tuple[str, str], object] = {}
+
+
+def _phase_histogram(path: str, phase: str):
+    """Get the pre-bound phase histogram child for a path and phase"""
+    child = _phase_children.get((path, phase))
+    if child is None:
+        child = REQUEST_PHASE_LATENCY.labels(path=path, phase=phase)
+        _phase_children[(path, phase)] = child
+    return child
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+from typing import Dict, List, Optional, Set
+import asyncio
+import json
+import os
+import random
+import time
+
+# How often a frame is pushed to subscribers
+METRICS_STREAM_INTERVAL_SECONDS = float(
+    os.getenv("METRICS_STREAM_INTERVAL_SECONDS", "1.0")
+)
+# Frames a subscriber may fall behind by before the oldest are dropped
+METRICS_STREAM_MAX_PENDING = int(os.getenv("METRICS_STREAM_MAX_PENDING", "8"))
+# Latency samples kept per model and interval for quantiles
+METRICS_STREAM_SAMPLES = int(os.getenv("METRICS_STREAM_SAMPLES", "1024"))
+
+
+def _quantile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+
+class ModelWindow:
+    """Per-model counters accumulated since the last frame."""
+
+    def __init__(self):
+        self.invocations = 0
+        self.failures = 0
+        self.total_invocations = 0
+        self.total_failures = 0
+        self.active = 0
+        self.samples: List[float] = []
+        self._seen = 0
+
+    def observe(self, success: bool, latency_ms: Optional[float]) -> None:
+        self.invocations += 1
+        self.total_invocations += 1
+        if not success:
+            self.failures += 1
+            self.total_failures += 1
+        if latency_ms is None:
+            # Answered locally, there is no upstream latency to sample
+            return
+        # Reservoir sampling keeps quantiles cheap under any load
+        self._seen += 1
+        if len(self.samples) < METRICS_STREAM_SAMPLES:
+            self.samples.append(latency_ms)
+        else:
+            slot = random.randrange(self._seen)
+            if slot < METRICS_STREAM_SAMPLES:
+                self.samples[slot] = latency_ms
+
+    def drain(self) -> dict:
+        """Summarize the interval and start a new one"""
+        samples = sorted(self.samples)
+        delta = {
+            "invocations": self.invocations,
+            "failures": self.failures,
+            "total_invocations": self.total_invocations,
+            "total_failures": self.total_failures,
+            "active_invocations": self.active,
+            "latency_ms": {
+                "p50": _quantile(samples, 0.5),
+                "p95": _quantile(samples, 0.95),
+                "p99": _quantile(samples, 0.99),
+            },
+        }
+        self.invocations = 0
+        self.failures = 0
+        self.samples = []
+        self._seen = 0
+        return delta
+
+    @property
+    def idle(self) -> bool:
+        return self.invocations == 0 and self.active == 0
+
+
+class Subscriber:
+    """A bounded mailbox of encoded frames for one client."""
+
+    def __init__(self, max_pending: int = METRICS_STREAM_MAX_PENDING):
+        # None marks the end of the stream
+        self.queue: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue(
+            max_pending
+        )
+        self.dropped = 0
+
+    def offer(self, frame: Optional[bytes]) -> None:
+        """Queue a frame, dropping the oldest one if the client lags"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(frame)
+
+    def close(self) -> None:
+        """End the stream once the client has read what is queued"""
+        self.offer(None)
+
+
+class LiveMetricsHub:
+    """
+    Pushes per-model metric deltas to Server-Sent Events subscribers.
+
+    MetricsCollector feeds every event into per-model windows. A single
+    ticker drains them once per interval and encodes one frame that is
+    shared by every subscriber, so the cost does not grow with the number
+    of clients. Frames carry cumulative totals next to the deltas, so a
+    client that had frames dropped still converges.
+    """
+
+    def __init__(self, interval: float = METRICS_STREAM_INTERVAL_SECONDS):
+        self.interval = interval
+        self._windows: Dict[str, ModelWindow] = {}
+        self._subscribers: Set[Subscriber] = set()
+        self._ticker: Optional[asyncio.Task] = None
+        self._sequence = 0
+        self._closed = False
+
+    def _window(self, model_id: str) -> ModelWindow:
+        window = self._windows.get(model_id)
+        if window is None:
+            window = self._windows[model_id] = ModelWindow()
+        return window
+
+    def record_invocation(
+        self, model_id: str, success: bool, latency_ms: Optional[float]
+    ) -> None:
+        self._window(model_id).observe(success, latency_ms)
+
+    def increment_active(self, model_id: str) -> None:
+        self._window(model_id).active += 1
+
+    def decrement_active(self, model_id: str) -> None:
+        self._window(model_id).active -= 1
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber()
+        if self._closed:
+            subscriber.close()
+            return subscriber
+        self._subscribers.add(subscriber)
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.get_running_loop().create_task(self._tick())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+        if not self._subscribers and self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+
+    def start(self) -> None:
+        """Accept subscribers again after close()"""
+        self._closed = False
+
+    def close(self) -> None:
+        """
+        End every stream and refuse new subscribers.
+
+        Streams never end on their own, and servers wait for open responses
+        before shutting down, so this must run as soon as shutdown begins.
+        """
+        self._closed = True
+        for subscriber in self._subscribers:
+            subscriber.close()
+        self._subscribers.clear()
+        if self._ticker is not None:
+            self._ticker.cancel()
+            self._ticker = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def frame(self) -> bytes:
+        """Drain every window into one encoded SSE frame"""
+        self._sequence += 1
+        models = {
+            model_id: window.drain()
+            for model_id, window in self._windows.items()
+            if not window.idle
+        }
+        data = json.dumps(
+            {
+                "seq": self._sequence,
+                "timestamp": time.time(),
+                "interval_s": self.interval,
+                "models": models,
+            },
+            separators=(",", ":"),
+        )
+        return (
+            f"id: {self._sequence}\nevent: metrics\ndata: {data}\n\n"
+        ).encode()
+
+    async def _tick(self) -> None:
+        # Start every subscription from a clean window
+        for window in self._windows.values():
+            window.drain()
+        while True:
+            await asyncio.sleep(self.interval)
+            frame = self.frame()
+            for subscriber in self._subscribers:
+                subscriber.offer(frame)
+
+    async def stream(self):
+        """Async generator of SSE frames for one client"""
+        subscriber = self.subscribe()
+        try:
+            yield b"retry: 1000\n\n"
+            while True:
+                frame = await subscriber.queue.get()
+                if frame is None:
+                    return
+                yield frame
+        finally:
+            self.unsubscribe(subscriber)
+
+
+live_metrics = LiveMetricsHub()
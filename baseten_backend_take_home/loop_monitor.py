@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+from collections import Counter as FrameCounter
+from typing import Optional
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from baseten_backend_take_home.prometheus_metrics import (
+    EVENT_LOOP_LAG,
+    EVENT_LOOP_SLOW_CALLBACKS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Event-loop monitoring is opt-in, it costs a background task and a thread
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+LOOP_LAG_INTERVAL_SECONDS = (
+    float(os.getenv("LOOP_LAG_INTERVAL_MS", "100")) / 1000
+)
+SLOW_CALLBACK_THRESHOLD_SECONDS = (
+    float(os.getenv("LOOP_SLOW_CALLBACK_THRESHOLD_MS", "100")) / 1000
+)
+
+# The sampling profiler endpoint is opt-in as well
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+
+
+class LoopMonitor:
+    """
+    Watches the health of the running event loop.
+
+    A heartbeat task wakes up every `interval` seconds and records how late
+    it was woken as event-loop lag. A watchdog thread checks the heartbeat:
+    when the loop has not come back for longer than `threshold`, whatever
+    callback is running is blocking it, and its stack is logged.
+    """
+
+    def __init__(
+        self,
+        interval: float = LOOP_LAG_INTERVAL_SECONDS,
+        threshold: float = SLOW_CALLBACK_THRESHOLD_SECONDS,
+    ):
+        self.interval = interval
+        self.threshold = threshold
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = time.monotonic()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        """Start monitoring the current event loop"""
+        if self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._beat())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-monitor-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        """Stop monitoring"""
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=self.interval * 2)
+            self._watchdog = None
+
+    async def _beat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            EVENT_LOOP_LAG.observe(max(0.0, now - expected))
+
+    def _watch(self) -> None:
+        # Only report a given stall once, it is identified by its heartbeat
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.threshold or heartbeat == reported:
+                continue
+            reported = heartbeat
+            EVENT_LOOP_SLOW_CALLBACKS.inc()
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            logger.warning(
+                "Event loop blocked for more than %.0fms, current stack:\n%s",
+                stalled * 1000,
+                stack,
+            )
+
+
+loop_monitor = LoopMonitor()
+
+
+def sample_stacks(
+    seconds: float, frequency: int = 100, thread_id: Optional[int] = None
+) -> str:
+    """
+    Sample thread stacks for `seconds` and fold them for flame graphs.
+
+    Meant to run off the event loop (e.g. in an executor) so the loop keeps
+    serving traffic while it is being sampled.
+
+    Args:
+        seconds: How long to sample for
+        frequency: Samples per second
+        thread_id: Only sample this thread, all other threads if None
+
+    Returns:
+        Collapsed stacks, one "frame;frame;frame count" line per stack, as
+        consumed by flamegraph.pl and speedscope
+    """
+    stacks = FrameCounter()
+    me = threading.get_ident()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    period = 1.0 / frequency
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me or (thread_id is not None and ident != thread_id):
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(
+                    f"{code.co_name} ({code.co_filename}:{frame.f_lineno})"
+                )
+                frame = frame.f_back
+            frames.append(names.get(ident, str(ident)))
+            stacks[";".join(reversed(frames))] += 1
+        time.sleep(period)
+
+    return "\n".join(f"{stack} {count}" for stack, count in stacks.items())
@@ -1,24 +1,59 @@
 #!/usr/bin/env python
-from typing import List, Optional
-from pydantic import BaseModel, Field
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
-from strawberry.fastapi import GraphQLRouter
+from typing import TYPE_CHECKING, List, Optional
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pydantic import BaseModel, Field, PrivateAttr
+from fastapi import APIRouter, FastAPI, Header, HTTPException, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse
 import time
 
-import aiohttp
-import strawberry
+import asyncio
+import logging
+import threading
 import json
 import os
+import signal
 
+from baseten_backend_take_home.models import normalize_priority
 from baseten_backend_take_home.repositories import (
-    organization_repository,
     model_repository,
+    organization_repository,
+    seed_sample_data,
 )
 from baseten_backend_take_home.prometheus_metrics import (
     MetricsCollector,
     MetricsEndpoints,
+    model_labels,
+)
+from baseten_backend_take_home.negative_cache import negative_cache
+from baseten_backend_take_home.live_metrics import live_metrics
+from baseten_backend_take_home.loop_monitor import (
+    LOOP_MONITOR_ENABLED,
+    PROFILER_ENABLED,
+    PROFILER_MAX_SECONDS,
+    loop_monitor,
+    sample_stacks,
 )
+from baseten_backend_take_home.traffic_recorder import traffic_recorder
+from baseten_backend_take_home.persistence import state_snapshotter
+from baseten_backend_take_home.dispatcher import (
+    DEFAULT_PRIORITY,
+    upstream_dispatcher,
+)
+from baseten_backend_take_home.sharding import SHARD_SIZE, invoke_sharded
+from baseten_backend_take_home.instrumentation import (
+    DEBUG_TRACES_ENABLED,
+    PhaseTimingMiddleware,
+    current_trace,
+    slowest_traces,
+)
+
+# aiohttp and strawberry are imported on first use, see warm_up_upstream()
+# and warm_up_graphql()
+if TYPE_CHECKING:
+    import aiohttp
+
+logger = logging.getLogger(__name__)
 
 
 # Unimplemented is an util for all the unimplemented stuff
@@ -32,23 +67,43 @@ class Unimplemented(Exception):
 # API Client
 # This is just a basic boilerplate to setup
 #################
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "100"))
+
+
 class Endpoint(BaseModel):
     url: str
     authorization: Optional[str] = Field(default_factory=lambda: None)
+    # One pooled session per endpoint, so connections are reused across
+    # invocations instead of opened and torn down for each of them
+    _session: Optional["aiohttp.ClientSession"] = PrivateAttr(default=None)
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=UPSTREAM_POOL_SIZE)
+            )
+        return self._session
 
-    async def exec(self, json_str: str) -> aiohttp.ClientResponse:
+    async def exec(self, json_str: str) -> "aiohttp.ClientResponse":
         headers = {
             "content-type": "application/json",
         }
         if self.authorization is not None:
             headers["authorization"] = self.authorization
 
-        async with aiohttp.ClientSession() as session:
-            return await session.post(
-                url=self.url,
-                data=json_str,
-                headers=headers,
-            )
+        # The connection goes back to the pool once the body has been read
+        return await self._get_session().post(
+            url=self.url,
+            data=json_str,
+            headers=headers,
+        )
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
 
 
 DEFAULT_ENDPOINT = Endpoint(
@@ -60,106 +115,65 @@ MOCK_ENDPOINT = Endpoint(
     url=f"{os.getenv('MOCK_SERVER_URL', 'http://localhost:8001')}/invoke"
 )
 
+# Reject invocations for models unknown to model_repository before they
+# reach the upstream
+VALIDATE_MODEL_IDS = os.getenv("VALIDATE_MODEL_IDS", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Create the sample organizations and models on startup
+SEED_SAMPLE_DATA = os.getenv("SEED_SAMPLE_DATA", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+# Import the upstream client before the app is ready, and build the GraphQL
+# app in the background right after, instead of on the first request that
+# needs them
+WARM_UP_ENABLED = os.getenv("WARM_UP_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
 
 #################
 # GRAPHQL API
-# This is just a basic boilerplate to setup a graphql api backed by strawberry
-# see: https://strawberry.rocks/docs for docs
+# The strawberry schema lives in graphql_schema, see: https://strawberry.rocks
+# Importing strawberry takes longer than the rest of the app, so the
+# schema is only built when /graphql is first hit or warmed up
 #################
-@strawberry.type
-class Model:
-    id: int
-    name: str
-
-
-@strawberry.type
-class Organization:
-    id: str
-    name: str
-    models: List[Model]
-
-
-@strawberry.type
-class Query:
-    @strawberry.field
-    async def organizations(self) -> List[Organization]:
-        orgs = organization_repository.get_all()
-        return [
-            Organization(
-                id=org.id,
-                name=org.name,
-                models=[
-                    Model(id=model.id, name=model.name) for model in org.models
-                ],
-            )
-            for org in orgs
-        ]
-
-    @strawberry.field
-    async def organization(self, id: str) -> Optional[Organization]:
-        org = organization_repository.get_by_id(id)
-        if org:
-            return Organization(
-                id=org.id,
-                name=org.name,
-                models=[
-                    Model(id=model.id, name=model.name) for model in org.models
-                ],
-            )
-        return None
-
-    @strawberry.field
-    async def models(self) -> List[Model]:
-        models = model_repository.get_all()
-        return [Model(id=model.id, name=model.name) for model in models]
-
-    @strawberry.field
-    async def model(self, id: int) -> Optional[Model]:
-        model = model_repository.get_by_id(id)
-        if model:
-            return Model(id=model.id, name=model.name)
-        return None
-
-
-@strawberry.type
-class Mutation:
-    @strawberry.mutation
-    async def create_organization(self, name: str) -> Organization:
-        org = organization_repository.create(name)
-        return Organization(
-            id=org.id,
-            name=org.name,
-            models=[
-                Model(id=model.id, name=model.name) for model in org.models
-            ],
-        )
+class LazyGraphQL:
+    """ASGI app that builds the strawberry GraphQL app on first use."""
+
+    def __init__(self):
+        self._app = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self._app is None:
+                from strawberry.asgi import GraphQL
+
+                from baseten_backend_take_home.graphql_schema import SCHEMA
+
+                self._app = GraphQL(SCHEMA)
+        return self._app
 
-    @strawberry.mutation
-    async def create_model(self, name: str) -> Model:
-        model = model_repository.create(name)
-        return Model(id=model.id, name=model.name)
-
-    @strawberry.mutation
-    async def add_model_to_organization(
-        self, organization_id: str, model_id: int
-    ) -> bool:
-        model = model_repository.get_by_id(model_id)
-        if model:
-            return organization_repository.add_model_to_organization(
-                organization_id, model
+    async def __call__(self, scope, receive, send):
+        app = self._app
+        if app is None:
+            # Build it off the event loop so other requests keep flowing
+            app = await asyncio.get_running_loop().run_in_executor(
+                None, self.load
             )
-        return False
-
-    @strawberry.mutation
-    async def remove_model_from_organization(
-        self, organization_id: str, model_id: int
-    ) -> bool:
-        return organization_repository.remove_model_from_organization(
-            organization_id, model_id
-        )
+        await app(scope, receive, send)
 
 
-SCHEMA = strawberry.Schema(Query, Mutation)
+graphql_app = LazyGraphQL()
 
 
 #################
@@ -186,10 +200,10 @@ class InvokeResponse(BaseModel):
     error_log: str
 
 
-app = FastAPI()
+router = APIRouter()
 
 
-@app.get("/healtz", response_class=HTMLResponse)
+@router.get("/healtz", response_class=HTMLResponse)
 def health_check():
     return """
         Welcome to baseten_take_home invoker,
@@ -197,86 +211,368 @@ def health_check():
     """
 
 
-@app.post("/invoke", response_model=InvokeResponse)
-async def invoke_model(request: InvokeRequest) -> InvokeResponse:
+@router.post("/invoke", response_model=InvokeResponse)
+async def invoke_model(
+    request: InvokeRequest,
+    x_priority: Optional[str] = Header(
+        default=None,
+        description="Dispatch lane, defaults to the organization's default",
+    ),
+) -> InvokeResponse:
+    try:
+        priority = normalize_priority(x_priority or None, "X-Priority")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    trace = current_trace()
+    trace.begin_handler()
+    try:
+        if not traffic_recorder.sample():
+            return await _invoke_model(request, trace, priority)
+        return await _record_invocation(request, trace, priority)
+    finally:
+        trace.end_handler()
+
+
+async def _record_invocation(
+    request: InvokeRequest, trace, priority: Optional[str] = None
+) -> InvokeResponse:
+    """Invoke the model and hand the request and outcome to the recorder"""
+    arrival = time.time()
+    start_time = time.perf_counter()
+    worklet_input = request.worklet_input
+    capture = {"served_by": "upstream"}
+    try:
+        invoke_response = await _invoke_model(
+            request, trace, priority, capture
+        )
+    except HTTPException as e:
+        traffic_recorder.record(
+            arrival=arrival,
+            model_id=worklet_input.model_id,
+            input=worklet_input.input,
+            outcome="error",
+            served_by=capture["served_by"],
+            gateway_latency_ms=(time.perf_counter() - start_time) * 1000,
+            error_log=str(e.detail),
+        )
+        raise
+    traffic_recorder.record(
+        arrival=arrival,
+        model_id=worklet_input.model_id,
+        input=worklet_input.input,
+        outcome="success" if invoke_response.success else "failure",
+        served_by=capture["served_by"],
+        gateway_latency_ms=(time.perf_counter() - start_time) * 1000,
+        upstream_latency_ms=invoke_response.latency_ms,
+        error_log=invoke_response.error_log,
+        worklet_output=invoke_response.worklet_output,
+    )
+    return invoke_response
+
+
+async def _invoke_model(
+    request: InvokeRequest,
+    trace,
+    priority: Optional[str] = None,
+    capture: Optional[dict] = None,
+) -> InvokeResponse:
     model_id = request.worklet_input.model_id
-    start_time = time.time()
+    input_size = len(request.worklet_input.input)
+
+    with trace.phase("validate"):
+        model = model_repository.resolve(model_id)
+        if model is None and not state_snapshotter.writable.is_set():
+            # The snapshot being hydrated may hold it, wait rather than
+            # reject a real model
+            await state_snapshotter.writable.wait()
+            model = model_repository.resolve(model_id)
+        known = not VALIDATE_MODEL_IDS or model is not None
+        # Every way of naming a model shares one negative cache entry
+        cache_key = str(model.id) if model is not None else model_id
+        cached_error = negative_cache.get(cache_key) if known else None
+        # Resolved once, so every metric of this invocation lands on the
+        # same label even if the registry changes while it is in flight
+        metric_children = model_labels.for_model(model)
+
+    if not known:
+        error_log = f"Model {model_id} does not exist"
+        MetricsCollector.record_rejected_invocation(
+            model_id, error_log, input_size, metric_children
+        )
+        if capture is not None:
+            capture["served_by"] = "rejected"
+        return InvokeResponse(
+            worklet_output=[],
+            success=False,
+            latency_ms=0,
+            error_log=error_log,
+        )
+
+    if cached_error is not None:
+        MetricsCollector.record_negative_cache_hit(
+            model_id, cached_error, input_size, metric_children
+        )
+        if capture is not None:
+            capture["served_by"] = "negative_cache"
+        return InvokeResponse(
+            worklet_output=[],
+            success=False,
+            latency_ms=0,
+            error_log=cached_error,
+        )
+
+    if priority is None and model is not None:
+        priority = organization_repository.default_priority_for_model(model.id)
+    if priority is None:
+        priority = DEFAULT_PRIORITY
+
+    start_time = time.perf_counter()
 
     # Increment active invocations gauge
-    MetricsCollector.increment_active_invocations(model_id)
+    MetricsCollector.increment_active_invocations(model_id, metric_children)
 
     try:
-        json_str = json.dumps(request.model_dump())
-        response = await MOCK_ENDPOINT.exec(json_str)
-        response_data = await response.json()
-        invoke_response = InvokeResponse(**response_data)
+        worklet_input = request.worklet_input
+        if (
+            model is not None
+            and model.splittable
+            and len(worklet_input.input) > SHARD_SIZE
+        ):
+            with trace.phase("upstream"):
+                response_data = await invoke_sharded(
+                    MOCK_ENDPOINT,
+                    model_id,
+                    worklet_input.input,
+                    priority=priority,
+                )
+        else:
+            with trace.phase("serialize"):
+                json_str = json.dumps(request.model_dump())
+            with trace.phase("dispatch"):
+                await upstream_dispatcher.acquire(priority)
+            try:
+                with trace.phase("upstream"):
+                    response = await MOCK_ENDPOINT.exec(json_str)
+                    response_data = await response.json()
+            finally:
+                upstream_dispatcher.release(priority)
+        with trace.phase("parse"):
+            invoke_response = InvokeResponse(**response_data)
+        if not invoke_response.success:
+            negative_cache.remember(cache_key, invoke_response.error_log)
 
         # Calculate metrics
-        end_time = time.time()
+        end_time = time.perf_counter()
         latency_seconds = end_time - start_time
         latency_ms = int(latency_seconds * 1000)
 
         # Record metrics using the metrics collector
-        MetricsCollector.record_invocation_metrics(
-            model_id=model_id,
-            success=invoke_response.success,
-            latency_seconds=latency_seconds,
-            latency_ms=latency_ms,
-            error_log=invoke_response.error_log,
-            input_size=len(request.worklet_input.input),
-            output_size=len(invoke_response.worklet_output)
-            if invoke_response.worklet_output
-            else 0,
-        )
+        with trace.phase("metrics"):
+            MetricsCollector.record_invocation_metrics(
+                model_id=model_id,
+                success=invoke_response.success,
+                latency_seconds=latency_seconds,
+                latency_ms=latency_ms,
+                error_log=invoke_response.error_log,
+                input_size=input_size,
+                output_size=len(invoke_response.worklet_output)
+                if invoke_response.worklet_output
+                else 0,
+                children=metric_children,
+            )
 
         return invoke_response
 
     except Exception as e:
         # Calculate metrics for failed invocation
-        end_time = time.time()
+        end_time = time.perf_counter()
         latency_seconds = end_time - start_time
         latency_ms = int(latency_seconds * 1000)
 
         # Record metrics for failed invocation
-        MetricsCollector.record_invocation_metrics(
-            model_id=model_id,
-            success=False,
-            latency_seconds=latency_seconds,
-            latency_ms=latency_ms,
-            error_log=str(e),
-            input_size=len(request.worklet_input.input),
-            output_size=0,
-        )
+        with trace.phase("metrics"):
+            MetricsCollector.record_invocation_metrics(
+                model_id=model_id,
+                success=False,
+                latency_seconds=latency_seconds,
+                latency_ms=latency_ms,
+                error_log=str(e),
+                input_size=input_size,
+                output_size=0,
+                children=metric_children,
+            )
 
         raise HTTPException(
             status_code=500, detail=f"Error invoking model: {str(e)}"
         )
     finally:
         # Decrement active invocations gauge
-        MetricsCollector.decrement_active_invocations(model_id)
+        MetricsCollector.decrement_active_invocations(
+            model_id, metric_children
+        )
 
 
 # Metrics endpoints using the MetricsEndpoints class
-@app.get("/metrics/history")
+@router.get("/metrics/history")
 async def get_invocation_history(
-    model_id: Optional[str] = None, limit: Optional[int] = 100, offset: int = 0
+    request: Request,
+    model_id: Optional[str] = None,
+    limit: Optional[int] = 100,
+    offset: int = 0,
 ):
     return await MetricsEndpoints.get_invocation_history(
-        model_id, limit, offset
+        model_id, limit, offset, request
+    )
+
+
+@router.get("/metrics/history/export")
+async def export_invocation_history(
+    request: Request,
+    format: str = "ndjson",
+    model_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    return await MetricsEndpoints.export_invocation_history(
+        format, model_id, start, end, request
     )
 
 
-@app.get("/metrics/stats")
-async def get_model_stats(model_id: Optional[str] = None):
-    return await MetricsEndpoints.get_model_stats(model_id)
+@router.get("/metrics/stats")
+async def get_model_stats(request: Request, model_id: Optional[str] = None):
+    return await MetricsEndpoints.get_model_stats(model_id, request)
+
 
+@router.get("/metrics/stream")
+async def stream_metrics():
+    return await MetricsEndpoints.stream_metrics()
 
-@app.get("/metrics")
+
+@router.get("/metrics")
 async def get_prometheus_metrics():
     return await MetricsEndpoints.get_prometheus_metrics()
 
 
-# You can also remove graphql and do pure HTTP/REST/JSON endpoint
-# https://fastapi.tiangolo.com/
-graphql_app = GraphQLRouter(SCHEMA)
-app.include_router(graphql_app, prefix="/graphql")
+@router.get("/debug/traces")
+async def get_slowest_traces(limit: Optional[int] = None):
+    """Phase traces of the slowest sampled requests, slowest first"""
+    if not DEBUG_TRACES_ENABLED:
+        raise HTTPException(status_code=404, detail="Traces are disabled")
+    return {"traces": [trace.to_dict() for trace in slowest_traces.get(limit)]}
+
+
+@router.get("/debug/profile", response_class=PlainTextResponse)
+async def profile(seconds: float = 10, frequency: int = 100):
+    """Sample the event loop thread and return collapsed flame graph stacks"""
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler is disabled")
+    if not 0 < seconds <= PROFILER_MAX_SECONDS or not 0 < frequency <= 1000:
+        raise HTTPException(
+            status_code=400,
+            detail=f"seconds must be in (0, {PROFILER_MAX_SECONDS}] and "
+            "frequency in (0, 1000]",
+        )
+    loop_thread_id = threading.get_ident()
+    return await asyncio.get_running_loop().run_in_executor(
+        None, sample_stacks, seconds, frequency, loop_thread_id
+    )
+
+
+def warm_up_upstream() -> None:
+    """Import the upstream client, which /invoke needs"""
+    try:
+        import aiohttp  # noqa: F401
+    except Exception:
+        logger.exception("Warm up failed, aiohttp loads on first use")
+
+
+def warm_up_graphql() -> None:
+    """Build the GraphQL app ahead of the first /graphql request"""
+    try:
+        graphql_app.load()
+    except Exception:
+        logger.exception("Warm up failed, GraphQL loads on first use")
+
+
+def close_streams_on_exit(loop: asyncio.AbstractEventLoop) -> None:
+    """
+    Close the live metrics streams as soon as a shutdown signal arrives.
+
+    The server waits for open responses before running the lifespan
+    shutdown, and /metrics/stream never ends on its own, so closing it there
+    would be too late. The server's own handlers still run afterwards.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(signum)
+        if not callable(previous):
+            continue
+
+        def handler(signum, frame, previous=previous):
+            loop.call_soon_threadsafe(live_metrics.close)
+            previous(signum, frame)
+
+        signal.signal(signum, handler)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # /healtz only passes once this yields. The upstream client is loaded
+    # first so no /invoke pays for it, hydration and the GraphQL app
+    # continue in the background.
+    loop = asyncio.get_running_loop()
+    # A snapshot replaces the registries, samples would only be overwritten
+    if app.state.seed_sample_data and not state_snapshotter.has_snapshot:
+        seed_sample_data()
+    state_snapshotter.start()
+    live_metrics.start()
+    close_streams_on_exit(loop)
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    if WARM_UP_ENABLED:
+        await loop.run_in_executor(None, warm_up_upstream)
+        # /graphql builds it off the loop too if it gets there first
+        loop.run_in_executor(None, warm_up_graphql)
+
+    yield
+
+    live_metrics.close()
+    await asyncio.gather(
+        loop_monitor.stop(),
+        state_snapshotter.stop(),
+        MOCK_ENDPOINT.close(),
+        DEFAULT_ENDPOINT.close(),
+        loop.run_in_executor(None, traffic_recorder.close),
+    )
+
+
+def create_app(seed: bool = SEED_SAMPLE_DATA) -> FastAPI:
+    """
+    Build the gateway app.
+
+    Nothing is started at import time, background subsystems are started and
+    stopped with the app's lifespan.
+
+    Args:
+        seed: Create the sample organizations and models on startup
+    """
+    app = FastAPI(lifespan=lifespan)
+    app.state.seed_sample_data = seed
+    app.add_middleware(PhaseTimingMiddleware)
+    app.include_router(router)
+    # You can also remove graphql and do pure HTTP/REST/JSON endpoint
+    # https://fastapi.tiangolo.com/
+    app.add_route(
+        "/graphql",
+        graphql_app,
+        methods=["GET", "POST"],
+        include_in_schema=False,
+    )
+    return app
+
+
+# Kept for `uvicorn baseten_backend_take_home.main:app`, the factory can also
+# be served directly with `uvicorn --factory ...main:create_app`
+app = create_app()
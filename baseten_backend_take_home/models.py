@@ -1,15 +1,49 @@
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Iterable, List, Optional, Set
 from datetime import datetime
 
+# Priority classes of upstream dispatch lanes, most urgent first
+PRIORITIES = ("high", "low")
+
+
+def normalize_priority(
+    priority: Optional[str], source: str = "Priority"
+) -> Optional[str]:
+    """
+    Case-fold a priority name and check that it is known.
+
+    Args:
+        priority: Priority name, None for no priority
+        source: Where the name came from, for the error message
+
+    Raises:
+        ValueError: If the name is not one of PRIORITIES
+    """
+    if priority is None:
+        return None
+    normalized = priority.strip().lower()
+    if normalized not in PRIORITIES:
+        raise ValueError(
+            f"{source} must be one of {', '.join(PRIORITIES)}, "
+            f"got {priority!r}"
+        )
+    return normalized
+
 
 @dataclass
 class Model:
     id: int
     name: str
+    # Output is element-wise in the input, so large inputs may be split
+    # into shards invoked in parallel
+    splittable: bool = False
 
     def to_dict(self) -> dict:
-        return {"id": self.id, "name": self.name}
+        return {
+            "id": self.id,
+            "name": self.name,
+            "splittable": self.splittable,
+        }
 
 
 @dataclass
@@ -17,31 +51,71 @@ class Organization:
     id: str
     name: str
     models: List[Model]
+    # Priority of invocations of this organization's models that don't ask
+    # for one, None falls back to the gateway default
+    default_priority: Optional[str] = None
 
     def __init__(
-        self, id: str, name: str, models: Optional[List[Model]] = None
+        self,
+        id: str,
+        name: str,
+        models: Optional[List[Model]] = None,
+        default_priority: Optional[str] = None,
     ):
         self.id = id
         self.name = name
-        self.models = models or []
+        self.models = []
+        self.default_priority = default_priority
+        # IDs of self.models, membership checks don't scan the list
+        self._model_ids: Set[int] = set()
+        self.add_models(models or [])
 
     def add_model(self, model: Model) -> None:
         """Add a model to this organization if it doesn't already exist"""
-        if model not in self.models:
+        if model.id not in self._model_ids:
             self.models.append(model)
+            self._model_ids.add(model.id)
+
+    def add_models(self, models: Iterable[Model]) -> int:
+        """Add the models that don't already exist, returns how many"""
+        added = 0
+        for model in models:
+            if model.id not in self._model_ids:
+                self.models.append(model)
+                self._model_ids.add(model.id)
+                added += 1
+        return added
+
+    def has_model(self, model_id: int) -> bool:
+        return model_id in self._model_ids
 
     def remove_model(self, model_id: int) -> bool:
         """Remove a model from this organization by ID.
         Returns True if removed, False if not found
         """
+        if model_id not in self._model_ids:
+            return False
         for i, model in enumerate(self.models):
             if model.id == model_id:
                 self.models.pop(i)
-                return True
-        return False
+                break
+        self._model_ids.discard(model_id)
+        return True
+
+    def remove_models(self, model_ids: Iterable[int]) -> Set[int]:
+        """Remove models by ID in a single pass, returns the removed IDs"""
+        removed = self._model_ids.intersection(model_ids)
+        if removed:
+            self.models = [
+                model for model in self.models if model.id not in removed
+            ]
+            self._model_ids -= removed
+        return removed
 
     def get_model(self, model_id: int) -> Optional[Model]:
         """Get a model by ID from this organization"""
+        if model_id not in self._model_ids:
+            return None
         for model in self.models:
             if model.id == model_id:
                 return model
@@ -52,6 +126,7 @@ class Organization:
             "id": self.id,
             "name": self.name,
             "models": [model.to_dict() for model in self.models],
+            "default_priority": self.default_priority,
         }
 
 
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+from dataclasses import dataclass
+from typing import Dict, Optional
+import os
+import re
+import time
+
+# Upstream error messages that are deterministic for a while, mapped to how
+# long (in seconds) a failure of that kind is remembered. Anything not
+# listed here (network errors, timeouts, ...) is transient and never cached.
+CACHEABLE_ERRORS = {
+    re.compile(r"^Model .+ does not exist$"): float(
+        os.getenv("NEGATIVE_CACHE_MISSING_TTL_SECONDS", "30")
+    ),
+    re.compile(r"^Model .+ is not deployed$"): float(
+        os.getenv("NEGATIVE_CACHE_UNDEPLOYED_TTL_SECONDS", "5")
+    ),
+}
+
+NEGATIVE_CACHE_MAX_ENTRIES = int(
+    os.getenv("NEGATIVE_CACHE_MAX_ENTRIES", "1024")
+)
+
+
+def classify_error(error_log: Optional[str]) -> Optional[float]:
+    """
+    Classify an upstream error_log message.
+
+    Args:
+        error_log: Error message returned by the worklet
+
+    Returns:
+        The TTL in seconds if the error is cacheable, None if transient
+    """
+    if not error_log:
+        return None
+    for pattern, ttl in CACHEABLE_ERRORS.items():
+        if pattern.match(error_log):
+            return ttl
+    return None
+
+
+@dataclass
+class NegativeCacheEntry:
+    """A remembered deterministic failure for a model"""
+
+    error_log: str
+    expires_at: float
+
+
+class NegativeCache:
+    """Short-TTL cache of deterministic upstream failures keyed by model"""
+
+    def __init__(self, max_entries: int = NEGATIVE_CACHE_MAX_ENTRIES):
+        self._entries: Dict[str, NegativeCacheEntry] = {}
+        self._max_entries = max_entries
+
+    def get(self, model_id: str) -> Optional[str]:
+        """Get the cached error_log for a model, if still fresh"""
+        entry = self._entries.get(model_id)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.monotonic():
+            del self._entries[model_id]
+            return None
+        return entry.error_log
+
+    def remember(self, model_id: str, error_log: Optional[str]) -> bool:
+        """
+        Remember a failure for a model if its error is cacheable.
+
+        Returns:
+            True if the failure was cached, False if it is transient
+        """
+        ttl = classify_error(error_log)
+        if ttl is None or ttl <= 0:
+            return False
+
+        self._entries.pop(model_id, None)
+        if len(self._entries) >= self._max_entries:
+            # Entries are kept in insertion order, drop the oldest one
+            del self._entries[next(iter(self._entries))]
+        self._entries[model_id] = NegativeCacheEntry(
+            error_log=error_log, expires_at=time.monotonic() + ttl
+        )
+        return True
+
+    def invalidate(self, model_id: Optional[str] = None) -> None:
+        """Forget a single model's failure, or every failure"""
+        if model_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(model_id, None)
+
+    def dump(self) -> list:
+        """Dump fresh entries as [model_id, error_log, seconds left]"""
+        now = time.monotonic()
+        return [
+            [model_id, entry.error_log, entry.expires_at - now]
+            for model_id, entry in self._entries.items()
+            if entry.expires_at > now
+        ]
+
+    def restore(self, entries: list, elapsed: float = 0.0) -> None:
+        """Load dumped entries, minus the time elapsed since the dump"""
+        now = time.monotonic()
+        for model_id, error_log, remaining in entries:
+            remaining -= elapsed
+            if remaining <= 0 or model_id in self._entries:
+                continue
+            if len(self._entries) >= self._max_entries:
+                break
+            self._entries[model_id] = NegativeCacheEntry(
+                error_log=error_log, expires_at=now + remaining
+            )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Global negative cache instance
+negative_cache = NegativeCache()
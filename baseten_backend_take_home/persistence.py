@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+from typing import Dict, Optional, Tuple
+import asyncio
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+
+from baseten_backend_take_home.negative_cache import negative_cache
+from baseten_backend_take_home.prometheus_metrics import (
+    STATE_SNAPSHOT_LOAD_SECONDS,
+    STATE_SNAPSHOT_SAVE_SECONDS,
+    STATE_SNAPSHOT_SIZE,
+)
+from baseten_backend_take_home.repositories import (
+    model_repository,
+    organization_repository,
+)
+
+logger = logging.getLogger(__name__)
+
+# Snapshots are disabled unless a path is configured
+STATE_SNAPSHOT_PATH = os.getenv("STATE_SNAPSHOT_PATH")
+STATE_SNAPSHOT_INTERVAL_SECONDS = float(
+    os.getenv("STATE_SNAPSHOT_INTERVAL_SECONDS", "60")
+)
+
+# File layout:
+#   MAGIC | index length (uint32, little endian) | index JSON | sections
+# The index maps each section name to its [offset, length] after the index,
+# sections are zlib compressed JSON. Readers mmap the file and only inflate
+# the sections they ask for.
+MAGIC = b"BTSNAP01"
+_HEADER = struct.Struct("<8sI")
+
+# Sections in hydration order, the registry goes first
+SECTIONS = ("models", "organizations", "negative_cache")
+
+
+def write_snapshot(path: str, sections: Dict[str, object]) -> int:
+    """
+    Atomically write sections to a snapshot file.
+
+    Returns:
+        The size of the written file in bytes
+    """
+    blobs = {
+        name: zlib.compress(
+            json.dumps(data, separators=(",", ":")).encode(), 6
+        )
+        for name, data in sections.items()
+    }
+
+    # Offsets are relative to the end of the index
+    offsets: Dict[str, Tuple[int, int]] = {}
+    position = 0
+    for name, blob in blobs.items():
+        offsets[name] = (position, len(blob))
+        position += len(blob)
+    index = {"created_at": time.time(), "sections": offsets}
+    index_bytes = json.dumps(index, separators=(",", ":")).encode()
+    data_start = _HEADER.size + len(index_bytes)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(index_bytes)))
+        f.write(index_bytes)
+        for blob in blobs.values():
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return data_start + position
+
+
+class SnapshotReader:
+    """Memory-maps a snapshot file and decodes sections on demand."""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_length = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a state snapshot")
+        index_start = _HEADER.size
+        index_end = index_start + index_length
+        index = json.loads(self._mmap[index_start:index_end])
+        self.created_at: float = index["created_at"]
+        self.size = len(self._mmap)
+        self._sections = {
+            name: (index_end + offset, length)
+            for name, (offset, length) in index["sections"].items()
+        }
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._sections
+
+    def section(self, name: str):
+        offset, length = self._sections[name]
+        end = offset + length
+        return json.loads(zlib.decompress(self._mmap[offset:end]))
+
+    def close(self) -> None:
+        self._mmap.close()
+
+
+class StateSnapshotter:
+    """
+    Periodically snapshots the registry and negative cache to disk and
+    hydrates them back in the background on startup.
+
+    Only the cheap dump of in-memory state happens on the event loop,
+    compression, file I/O and decoding run in the default executor.
+
+    Registry writes wait for writable while hydration runs, so none are
+    replaced by the snapshot or reuse its IDs. Nothing is saved unless the
+    snapshot was loaded or there was none: a snapshot that failed to load,
+    or was not loaded yet at shutdown, is never overwritten.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = STATE_SNAPSHOT_PATH,
+        interval: float = STATE_SNAPSHOT_INTERVAL_SECONDS,
+    ):
+        self.path = path
+        self.interval = interval
+        # Set once the snapshot is loaded or known not to exist
+        self.hydrated = asyncio.Event()
+        # Cleared while hydration runs
+        self.writable = asyncio.Event()
+        self.writable.set()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    @property
+    def has_snapshot(self) -> bool:
+        """Whether start() will hydrate from an existing snapshot"""
+        return self.enabled and os.path.exists(self.path)
+
+    def start(self) -> None:
+        """Hydrate in the background, then snapshot every interval"""
+        if not self.enabled:
+            self.hydrated.set()
+            return
+        if self._task is None or self._task.done():
+            self.writable.clear()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop snapshotting and write a final snapshot"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.writable.set()
+        if self.enabled and self.hydrated.is_set():
+            await self.save()
+
+    async def save(self) -> int:
+        """Write a snapshot, returns its size in bytes"""
+        sections = {
+            "models": model_repository.dump(),
+            "organizations": organization_repository.dump(),
+            "negative_cache": negative_cache.dump(),
+        }
+        start = time.perf_counter()
+        size = await asyncio.get_running_loop().run_in_executor(
+            None, write_snapshot, self.path, sections
+        )
+        STATE_SNAPSHOT_SAVE_SECONDS.set(time.perf_counter() - start)
+        STATE_SNAPSHOT_SIZE.set(size)
+        return size
+
+    async def hydrate(self) -> bool:
+        """Load the snapshot at path, returns False if there is none"""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            reader = await loop.run_in_executor(
+                None, SnapshotReader, self.path
+            )
+        except FileNotFoundError:
+            return False
+
+        try:
+            sections = {}
+            for name in SECTIONS:
+                if name in reader:
+                    sections[name] = await loop.run_in_executor(
+                        None, reader.section, name
+                    )
+            elapsed = max(0.0, time.time() - reader.created_at)
+            size = reader.size
+        finally:
+            reader.close()
+
+        # Apply everything at once so requests never see half a registry
+        if "models" in sections:
+            model_repository.restore(sections["models"])
+        if "organizations" in sections:
+            organization_repository.restore(
+                sections["organizations"], model_repository
+            )
+        if "negative_cache" in sections:
+            negative_cache.restore(sections["negative_cache"], elapsed)
+
+        load_seconds = time.perf_counter() - start
+        STATE_SNAPSHOT_LOAD_SECONDS.set(load_seconds)
+        STATE_SNAPSHOT_SIZE.set(size)
+        logger.info(
+            "Hydrated state snapshot %s (%d bytes) in %.1fms",
+            self.path,
+            size,
+            load_seconds * 1000,
+        )
+        return True
+
+    async def _run(self) -> None:
+        try:
+            await self.hydrate()
+        except Exception:
+            logger.exception(
+                "Could not hydrate state snapshot %s, it will not be "
+                "overwritten",
+                self.path,
+            )
+            return
+        finally:
+            self.writable.set()
+        self.hydrated.set()
+
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save()
+            except Exception:
+                logger.exception(
+                    "Could not write state snapshot %s", self.path
+                )
+
+
+state_snapshotter = StateSnapshotter()
@@ -1,8 +1,8 @@
 #!/usr/bin/env python
-from typing import Optional, List
+from typing import Dict, Optional, List
 from pydantic import BaseModel
-from fastapi import HTTPException
-from fastapi.responses import Response
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from prometheus_client import (
     Counter,
     Histogram,
@@ -10,9 +10,27 @@ from prometheus_client import (
     generate_latest,
     CONTENT_TYPE_LATEST,
 )
-import time
+from datetime import datetime
+import asyncio
+import csv
+import io
+import json
+import os
 
-from baseten_backend_take_home.repositories import metrics_repository
+from baseten_backend_take_home.live_metrics import live_metrics
+from baseten_backend_take_home.models import InvocationRecord, Model
+from baseten_backend_take_home.repositories import (
+    metrics_repository,
+    model_repository,
+)
+from baseten_backend_take_home.snapshot_cache import (
+    StreamCompressor,
+    accepted_encoding,
+    etag_for,
+    is_not_modified,
+    not_modified_response,
+    snapshot_cache,
+)
 
 # Prometheus metrics
 INVOCATION_COUNTER = Counter(
@@ -46,19 +64,258 @@ SUCCESS_RATE = Gauge(
     ["model_id"],
 )
 
+REQUEST_PHASE_LATENCY = Histogram(
+    "http_request_phase_seconds",
+    "Time spent in each named phase of a sampled request in seconds",
+    ["path", "phase"],
+    buckets=[
+        0.0001,
+        0.0005,
+        0.001,
+        0.005,
+        0.01,
+        0.05,
+        0.1,
+        0.5,
+        1.0,
+        2.5,
+        5.0,
+        10.0,
+    ],
+)
+
+SHARD_FANOUT = Histogram(
+    "model_invocation_shards",
+    "Number of shards a sharded invocation was split into",
+    buckets=[2, 4, 8, 16, 32, 64, 128, 256],
+)
+
+SHARD_REASSEMBLY_LATENCY = Histogram(
+    "model_invocation_shard_reassembly_seconds",
+    "Time spent reassembling shard outputs in seconds",
+    buckets=[0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5],
+)
+
+UPSTREAM_DISPATCH_WAIT = Histogram(
+    "upstream_dispatch_wait_seconds",
+    "Time upstream calls waited for a dispatch slot in seconds",
+    ["lane"],
+    buckets=[
+        0.0005,
+        0.001,
+        0.005,
+        0.01,
+        0.05,
+        0.1,
+        0.25,
+        0.5,
+        1.0,
+        2.5,
+        5.0,
+        10.0,
+    ],
+)
+
+UPSTREAM_DISPATCHED = Counter(
+    "upstream_dispatched_total",
+    "Number of upstream calls dispatched",
+    ["lane"],
+)
+
+UPSTREAM_DISPATCH_QUEUE_DEPTH = Gauge(
+    "upstream_dispatch_queue_depth",
+    "Number of upstream calls waiting for a dispatch slot",
+    ["lane"],
+)
+
+UPSTREAM_DISPATCH_IN_FLIGHT = Gauge(
+    "upstream_dispatch_in_flight",
+    "Number of upstream calls holding a dispatch slot",
+    ["lane"],
+)
+
+STATE_SNAPSHOT_SIZE = Gauge(
+    "state_snapshot_size_bytes",
+    "Size of the last written or loaded state snapshot in bytes",
+)
+
+STATE_SNAPSHOT_LOAD_SECONDS = Gauge(
+    "state_snapshot_load_seconds",
+    "Time it took to hydrate the state snapshot at startup in seconds",
+)
+
+STATE_SNAPSHOT_SAVE_SECONDS = Gauge(
+    "state_snapshot_save_seconds",
+    "Time it took to write the last state snapshot in seconds",
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Delay between when the event loop should and did run a timer",
+    buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5],
+)
+
+EVENT_LOOP_SLOW_CALLBACKS = Counter(
+    "event_loop_slow_callbacks_total",
+    "Number of times a callback blocked the event loop past the threshold",
+)
+
+MODEL_INFO = Gauge(
+    "model_info",
+    "Name of the model behind each model_id label value, always 1",
+    ["model_id", "name"],
+)
+
+# model_id comes straight from the request body, so label values are
+# restricted to models known to model_repository, labelled by their ID.
+# Everything else, and any model past the per-family series cap, is folded
+# into OTHER_MODEL_LABEL.
+OTHER_MODEL_LABEL = "other"
+MAX_MODEL_LABELS = int(os.getenv("METRICS_MAX_MODEL_LABELS", "500"))
+
+
+class ModelMetricChildren:
+    """Pre-bound metric children for a single model_id label value."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.success = INVOCATION_COUNTER.labels(
+            model_id=label, status="success"
+        )
+        self.failure = INVOCATION_COUNTER.labels(
+            model_id=label, status="failure"
+        )
+        self.negative_cache_hit = INVOCATION_COUNTER.labels(
+            model_id=label, status="negative_cache_hit"
+        )
+        self.rejected = INVOCATION_COUNTER.labels(
+            model_id=label, status="rejected"
+        )
+        self.latency = INVOCATION_LATENCY.labels(model_id=label)
+        self.active = ACTIVE_INVOCATIONS.labels(model_id=label)
+        self.total = TOTAL_INVOCATIONS.labels(model_id=label)
+        self.success_rate = SUCCESS_RATE.labels(model_id=label)
+        self.total_invocations = 0
+        self.successful_invocations = 0
+        # Model name last exported in MODEL_INFO
+        self.name: Optional[str] = None
+
+
+class ModelLabelCache:
+    """Maps raw model_ids to a bounded set of pre-bound metric children."""
+
+    def __init__(self, max_labels: int = MAX_MODEL_LABELS):
+        self._children: Dict[str, ModelMetricChildren] = {}
+        self._max_labels = max_labels
+        self._other = ModelMetricChildren(OTHER_MODEL_LABEL)
+
+    def get(self, model_id: str) -> ModelMetricChildren:
+        """Get the metric children for a model_id, or the overflow bucket"""
+        return self.for_model(model_repository.resolve(model_id))
+
+    def for_model(self, model: Optional[Model]) -> ModelMetricChildren:
+        """Get the metric children for a resolved model"""
+        if model is None:
+            return self._other
+
+        label = str(model.id)
+        children = self._children.get(label)
+        if children is None:
+            if len(self._children) >= self._max_labels:
+                return self._other
+            children = ModelMetricChildren(label)
+            self._children[label] = children
+        if children.name != model.name:
+            # New or renamed model, keep a single info series per label
+            if children.name is not None:
+                MODEL_INFO.remove(label, children.name)
+            MODEL_INFO.labels(model_id=label, name=model.name).set(1)
+            children.name = model.name
+        return children
+
+    def __len__(self) -> int:
+        return len(self._children)
+
+
+model_labels = ModelLabelCache()
+
 
 class MetricsCollector:
-    """Handles Prometheus metrics collection and updates."""
+    """
+    Handles Prometheus metrics collection and updates.
+
+    Every method takes the metric children the invocation resolved once,
+    so all of its updates land on the same label even if the registry
+    changes while it is in flight. Without them model_id is resolved again.
+    """
 
     @staticmethod
-    def increment_active_invocations(model_id: str):
+    def increment_active_invocations(
+        model_id: str, children: Optional[ModelMetricChildren] = None
+    ):
         """Increment active invocations gauge for a model."""
-        ACTIVE_INVOCATIONS.labels(model_id=model_id).inc()
+        if children is None:
+            children = model_labels.get(model_id)
+        children.active.inc()
+        live_metrics.increment_active(children.label)
 
     @staticmethod
-    def decrement_active_invocations(model_id: str):
+    def decrement_active_invocations(
+        model_id: str, children: Optional[ModelMetricChildren] = None
+    ):
         """Decrement active invocations gauge for a model."""
-        ACTIVE_INVOCATIONS.labels(model_id=model_id).dec()
+        if children is None:
+            children = model_labels.get(model_id)
+        children.active.dec()
+        live_metrics.decrement_active(children.label)
+
+    @staticmethod
+    def record_negative_cache_hit(
+        model_id: str,
+        error_log: str,
+        input_size: int,
+        children: Optional[ModelMetricChildren] = None,
+    ):
+        """Record an invocation answered from the negative cache."""
+        if children is None:
+            children = model_labels.get(model_id)
+        children.negative_cache_hit.inc()
+        MetricsCollector._record_local_failure(
+            model_id, error_log, input_size, children
+        )
+
+    @staticmethod
+    def record_rejected_invocation(
+        model_id: str,
+        error_log: str,
+        input_size: int,
+        children: Optional[ModelMetricChildren] = None,
+    ):
+        """Record an invocation rejected locally for an unknown model."""
+        if children is None:
+            children = model_labels.get(model_id)
+        children.rejected.inc()
+        MetricsCollector._record_local_failure(
+            model_id, error_log, input_size, children
+        )
+
+    @staticmethod
+    def _record_local_failure(
+        model_id: str,
+        error_log: str,
+        input_size: int,
+        children: ModelMetricChildren,
+    ):
+        """
+        Count an invocation failed without calling the upstream.
+
+        It goes into the stats as a zero latency failure, so they reflect
+        what clients see, but not into the latency histogram.
+        """
+        live_metrics.record_invocation(children.label, False, None)
+        MetricsCollector._record_stats(
+            model_id, False, 0, error_log, input_size, 0, children
+        )
 
     @staticmethod
     def record_invocation_metrics(
@@ -69,13 +326,41 @@ class MetricsCollector:
         error_log: str,
         input_size: int,
         output_size: int,
+        children: Optional[ModelMetricChildren] = None,
     ):
         """Record metrics for a completed invocation."""
         # Update Prometheus metrics
-        status = "success" if success else "failure"
-        INVOCATION_COUNTER.labels(model_id=model_id, status=status).inc()
-        INVOCATION_LATENCY.labels(model_id=model_id).observe(latency_seconds)
+        if children is None:
+            children = model_labels.get(model_id)
+        if success:
+            children.success.inc()
+        else:
+            children.failure.inc()
+        children.latency.observe(latency_seconds)
+        live_metrics.record_invocation(
+            children.label, success, latency_seconds * 1000
+        )
+        MetricsCollector._record_stats(
+            model_id,
+            success,
+            latency_ms,
+            error_log,
+            input_size,
+            output_size,
+            children,
+        )
 
+    @staticmethod
+    def _record_stats(
+        model_id: str,
+        success: bool,
+        latency_ms: int,
+        error_log: str,
+        input_size: int,
+        output_size: int,
+        children: ModelMetricChildren,
+    ):
+        """Update the invocation history and the per-label gauges."""
         # Store detailed metrics in repository
         metrics_repository.record_invocation(
             model_id=model_id,
@@ -86,16 +371,15 @@ class MetricsCollector:
             output_size=output_size,
         )
 
-        # Update gauges with latest stats
-        stats = metrics_repository.get_model_stats(model_id)
-        if model_id in stats:
-            model_stats = stats[model_id]
-            TOTAL_INVOCATIONS.labels(model_id=model_id).set(
-                model_stats.total_invocations
-            )
-            SUCCESS_RATE.labels(model_id=model_id).set(
-                model_stats.success_rate
-            )
+        # Update gauges per label, so every model_id variant (and the
+        # overflow bucket) folded into it is accounted for
+        children.total_invocations += 1
+        if success:
+            children.successful_invocations += 1
+        children.total.set(children.total_invocations)
+        children.success_rate.set(
+            children.successful_invocations / children.total_invocations * 100
+        )
 
 
 # Pydantic models for metrics endpoints
@@ -110,6 +394,45 @@ class ModelStatsResponse(BaseModel):
     stats: dict
 
 
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+EXPORT_CHUNK_SIZE = int(os.getenv("METRICS_EXPORT_CHUNK_SIZE", "1000"))
+EXPORT_FIELDS = [
+    "id",
+    "model_id",
+    "timestamp",
+    "success",
+    "latency_ms",
+    "error_log",
+    "input_size",
+    "output_size",
+]
+
+
+def _ndjson_chunk(records: List[InvocationRecord]) -> str:
+    return "".join(
+        json.dumps(record.to_dict(), separators=(",", ":")) + "\n"
+        for record in records
+    )
+
+
+def _csv_header() -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(EXPORT_FIELDS)
+    return buffer.getvalue()
+
+
+def _csv_chunk(records: List[InvocationRecord]) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for record in records:
+        row = record.to_dict()
+        writer.writerow([row[field] for field in EXPORT_FIELDS])
+    return buffer.getvalue()
+
+
 class MetricsEndpoints:
     """Handles metrics-related HTTP endpoints."""
 
@@ -118,7 +441,8 @@ class MetricsEndpoints:
         model_id: Optional[str] = None,
         limit: Optional[int] = 100,
         offset: int = 0,
-    ) -> InvocationHistoryResponse:
+        request: Optional[Request] = None,
+    ) -> Response:
         """
         Get invocation history for all models or a specific model.
 
@@ -126,28 +450,41 @@ class MetricsEndpoints:
             model_id: Optional model ID to filter by
             limit: Maximum number of records to return (default: 100)
             offset: Number of records to skip (default: 0)
+            request: Incoming request, for conditional GETs and compression
 
         Returns:
-            InvocationHistoryResponse with history records and pagination info
+            InvocationHistoryResponse with history records and pagination
+            info, or 304 Not Modified if the client's copy is current
         """
         try:
-            # Get invocation history from repository
-            history = metrics_repository.get_invocation_history(
-                model_id, limit, offset
-            )
+            version = metrics_repository.version
+            etag = etag_for(version)
+            if is_not_modified(request, etag):
+                return not_modified_response(etag)
 
-            # Convert to dict format
-            history_dicts = [record.to_dict() for record in history]
+            key = ("history", model_id, limit, offset)
+            snapshot = snapshot_cache.get(key, version)
+            if snapshot is None:
+                # Get invocation history from repository
+                history = metrics_repository.get_invocation_history(
+                    model_id, limit, offset
+                )
 
-            # Get total count for pagination
-            total_count = metrics_repository.get_total_invocations()
+                # Convert to dict format
+                history_dicts = [record.to_dict() for record in history]
 
-            return InvocationHistoryResponse(
-                history=history_dicts,
-                total_count=total_count,
-                offset=offset,
-                limit=limit,
-            )
+                # Get total count for pagination
+                total_count = metrics_repository.get_total_invocations()
+
+                body = InvocationHistoryResponse(
+                    history=history_dicts,
+                    total_count=total_count,
+                    offset=offset,
+                    limit=limit,
+                ).model_dump_json()
+                snapshot = snapshot_cache.put(key, version, body.encode())
+
+            return snapshot.response(request)
         except Exception as e:
             raise HTTPException(
                 status_code=500,
@@ -157,37 +494,49 @@ class MetricsEndpoints:
     @staticmethod
     async def get_model_stats(
         model_id: Optional[str] = None,
-    ) -> ModelStatsResponse:
+        request: Optional[Request] = None,
+    ) -> Response:
         """
         Get success/failure statistics for all models or a specific model.
 
         Args:
             model_id: Optional model ID to get stats for specific model
+            request: Incoming request, for conditional GETs and compression
 
         Returns:
-            ModelStatsResponse with success/failure counts and rates
+            ModelStatsResponse with success/failure counts and rates, or
+            304 Not Modified if the client's copy is current
         """
         try:
-            if model_id:
-                # Get stats for specific model
-                stats = metrics_repository.get_model_stats(model_id)
-                if not stats:
-                    raise HTTPException(
-                        status_code=404,
-                        detail=f"No stats found for model: {model_id}",
-                    )
+            version = metrics_repository.version
+            etag = etag_for(version)
+
+            key = ("stats", model_id)
+            snapshot = snapshot_cache.get(key, version)
+            if snapshot is None:
+                if model_id:
+                    # Get stats for specific model
+                    stats = metrics_repository.get_model_stats(model_id)
+                    if not stats:
+                        raise HTTPException(
+                            status_code=404,
+                            detail=f"No stats found for model: {model_id}",
+                        )
+                else:
+                    # Get stats for all models
+                    stats = metrics_repository.get_model_stats()
+
                 # Convert to dict format
                 stats_dict = {
                     mid: stat.to_dict() for mid, stat in stats.items()
                 }
-            else:
-                # Get stats for all models
-                stats = metrics_repository.get_model_stats()
-                stats_dict = {
-                    mid: stat.to_dict() for mid, stat in stats.items()
-                }
+                body = ModelStatsResponse(stats=stats_dict).model_dump_json()
+                snapshot = snapshot_cache.put(key, version, body.encode())
 
-            return ModelStatsResponse(stats=stats_dict)
+            # Checked after the lookup so unknown models still 404
+            if is_not_modified(request, etag):
+                return not_modified_response(etag)
+            return snapshot.response(request)
         except HTTPException:
             raise
         except Exception as e:
@@ -196,6 +545,81 @@ class MetricsEndpoints:
                 detail=f"Error retrieving model stats: {str(e)}",
             )
 
+    @staticmethod
+    async def export_invocation_history(
+        format: str = "ndjson",
+        model_id: Optional[str] = None,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        request: Optional[Request] = None,
+    ) -> StreamingResponse:
+        """
+        Stream invocation history as NDJSON or CSV, oldest first.
+
+        Records are encoded in chunks from a generator over the repository,
+        so memory stays flat regardless of the result size, and the event
+        loop is yielded to between chunks.
+
+        Args:
+            format: "ndjson" or "csv"
+            model_id: Optional model ID to filter by
+            start: Only records at or after this time
+            end: Only records before this time
+            request: Incoming request, for Accept-Encoding
+
+        Returns:
+            StreamingResponse, compressed if the client accepts it
+        """
+        if format not in EXPORT_MEDIA_TYPES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported export format: {format}",
+            )
+
+        chunks = metrics_repository.iter_invocation_history(
+            model_id, start, end, EXPORT_CHUNK_SIZE
+        )
+        encode = _csv_chunk if format == "csv" else _ndjson_chunk
+        encoding = accepted_encoding(request)
+
+        async def generate():
+            compressor = StreamCompressor(encoding) if encoding else None
+            if format == "csv":
+                header = _csv_header().encode()
+                yield compressor.compress(header) if compressor else header
+            for chunk in chunks:
+                if chunk:
+                    data = encode(chunk).encode()
+                    if compressor:
+                        data = compressor.compress(data)
+                    if data:
+                        yield data
+                # Let /invoke traffic run between chunks, matching or not
+                await asyncio.sleep(0)
+            if compressor:
+                yield compressor.flush()
+
+        headers = {"Vary": "Accept-Encoding"}
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return StreamingResponse(
+            generate(), media_type=EXPORT_MEDIA_TYPES[format], headers=headers
+        )
+
+    @staticmethod
+    async def stream_metrics() -> StreamingResponse:
+        """
+        Push per-model metric deltas as Server-Sent Events.
+
+        Returns:
+            StreamingResponse emitting one "metrics" event per interval
+        """
+        return StreamingResponse(
+            live_metrics.stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
     @staticmethod
     async def get_prometheus_metrics():
         """
@@ -1,6 +1,8 @@
-from typing import Dict, List, Optional
-from baseten_backend_take_home.models import Organization, Model
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from baseten_backend_take_home.models import PRIORITIES, Organization, Model
 from datetime import datetime
+import bisect
+import time
 from baseten_backend_take_home.models import InvocationRecord, ModelStats
 
 
@@ -9,19 +11,47 @@ class ModelRepository:
 
     def __init__(self):
         self._models: Dict[int, Model] = {}
+        self._models_by_name: Dict[str, Model] = {}
         self._next_id = 1
 
-    def create(self, name: str) -> Model:
+    def create(self, name: str, splittable: bool = False) -> Model:
         """Create a new model with auto-generated ID"""
-        model = Model(id=self._next_id, name=name)
+        model = Model(id=self._next_id, name=name, splittable=splittable)
         self._models[self._next_id] = model
+        self._models_by_name.setdefault(name.lower(), model)
         self._next_id += 1
         return model
 
+    def create_many(self, models: Iterable[Tuple[str, bool]]) -> List[Model]:
+        """Create models from (name, splittable) pairs with consecutive IDs"""
+        created = [
+            Model(id=model_id, name=name, splittable=splittable)
+            for model_id, (name, splittable) in enumerate(
+                models, start=self._next_id
+            )
+        ]
+        for model in created:
+            self._models[model.id] = model
+            self._models_by_name.setdefault(model.name.lower(), model)
+        self._next_id += len(created)
+        return created
+
     def get_by_id(self, model_id: int) -> Optional[Model]:
         """Get a model by ID"""
         return self._models.get(model_id)
 
+    def get_by_name(self, name: str) -> Optional[Model]:
+        """Get a model by name (case-insensitive)"""
+        return self._models_by_name.get(name.lower())
+
+    def resolve(self, model_ref: str) -> Optional[Model]:
+        """Resolve a worklet model_id (numeric ID or name) to a model"""
+        if model_ref.isdigit():
+            model = self.get_by_id(int(model_ref))
+            if model:
+                return model
+        return self.get_by_name(model_ref)
+
     def get_all(self) -> List[Model]:
         """Get all models"""
         return list(self._models.values())
@@ -29,29 +59,69 @@ class ModelRepository:
     def update(self, model_id: int, name: str) -> Optional[Model]:
         """Update a model's name"""
         if model_id in self._models:
-            self._models[model_id].name = name
-            return self._models[model_id]
+            model = self._models[model_id]
+            self._unindex_name(model)
+            model.name = name
+            self._models_by_name.setdefault(name.lower(), model)
+            return model
         return None
 
     def delete(self, model_id: int) -> bool:
         """Delete a model by ID"""
         if model_id in self._models:
-            del self._models[model_id]
+            self._unindex_name(self._models.pop(model_id))
             return True
         return False
 
+    def dump(self) -> dict:
+        """Dump the repository state for a snapshot"""
+        return {
+            "next_id": self._next_id,
+            "models": [
+                [model.id, model.name, model.splittable]
+                for model in self._models.values()
+            ],
+        }
+
+    def restore(self, data: dict) -> None:
+        """Replace the repository state with a dumped one"""
+        self._models = {}
+        self._models_by_name = {}
+        for model_id, name, splittable in data["models"]:
+            model = Model(id=model_id, name=name, splittable=splittable)
+            self._models[model_id] = model
+            self._models_by_name.setdefault(name.lower(), model)
+        self._next_id = data["next_id"]
+
+    def _unindex_name(self, model: Model) -> None:
+        """Drop a model from the name index, promoting a namesake if any"""
+        key = model.name.lower()
+        if self._models_by_name.get(key) is not model:
+            return
+        del self._models_by_name[key]
+        for other in self._models.values():
+            if other is not model and other.name.lower() == key:
+                self._models_by_name[key] = other
+                break
+
 
 class OrganizationRepository:
     """Repository for managing Organization entities in memory"""
 
     def __init__(self):
         self._organizations: Dict[str, Organization] = {}
+        # Model ID -> IDs of the organizations the model belongs to
+        self._organizations_by_model: Dict[int, Set[str]] = {}
         self._next_id = 1
 
-    def create(self, name: str) -> Organization:
+    def create(
+        self, name: str, default_priority: Optional[str] = None
+    ) -> Organization:
         """Create a new organization with auto-generated ID"""
         org_id = str(self._next_id)
-        organization = Organization(id=org_id, name=name)
+        organization = Organization(
+            id=org_id, name=name, default_priority=default_priority
+        )
         self._organizations[org_id] = organization
         self._next_id += 1
         return organization
@@ -71,10 +141,20 @@ class OrganizationRepository:
             return self._organizations[org_id]
         return None
 
+    def set_default_priority(
+        self, org_id: str, priority: Optional[str]
+    ) -> Optional[Organization]:
+        """Set or clear an organization's default invocation priority"""
+        if org_id in self._organizations:
+            self._organizations[org_id].default_priority = priority
+            return self._organizations[org_id]
+        return None
+
     def delete(self, org_id: str) -> bool:
         """Delete an organization by ID"""
         if org_id in self._organizations:
-            del self._organizations[org_id]
+            for model in self._organizations.pop(org_id).models:
+                self._unindex_membership(org_id, model.id)
             return True
         return False
 
@@ -82,26 +162,138 @@ class OrganizationRepository:
         """Add a model to an organization"""
         if org_id in self._organizations:
             self._organizations[org_id].add_model(model)
+            self._organizations_by_model.setdefault(model.id, set()).add(
+                org_id
+            )
             return True
         return False
 
+    def add_models_to_organization(
+        self, org_id: str, models: List[Model]
+    ) -> Optional[int]:
+        """
+        Add several models to an organization.
+
+        Returns:
+            How many of the models were not in the organization yet, None
+            if the organization does not exist
+        """
+        organization = self._organizations.get(org_id)
+        if organization is None:
+            return None
+        added = organization.add_models(models)
+        for model in models:
+            self._organizations_by_model.setdefault(model.id, set()).add(
+                org_id
+            )
+        return added
+
     def remove_model_from_organization(
         self, org_id: str, model_id: int
     ) -> bool:
         """Remove a model from an organization"""
         if org_id in self._organizations:
-            return self._organizations[org_id].remove_model(model_id)
+            if self._organizations[org_id].remove_model(model_id):
+                self._unindex_membership(org_id, model_id)
+                return True
         return False
 
+    def remove_models_from_organization(
+        self, org_id: str, model_ids: Iterable[int]
+    ) -> Optional[int]:
+        """
+        Remove several models from an organization by ID.
+
+        Returns:
+            How many of the models were removed, None if the organization
+            does not exist
+        """
+        organization = self._organizations.get(org_id)
+        if organization is None:
+            return None
+        removed = organization.remove_models(model_ids)
+        for model_id in removed:
+            self._unindex_membership(org_id, model_id)
+        return len(removed)
+
+    def default_priority_for_model(self, model_id: int) -> Optional[str]:
+        """
+        Get the default priority of the organizations owning a model.
+
+        A model shared by several organizations gets the most urgent of
+        their defaults.
+        """
+        priorities = {
+            self._organizations[org_id].default_priority
+            for org_id in self._organizations_by_model.get(model_id, ())
+        }
+        for priority in PRIORITIES:
+            if priority in priorities:
+                return priority
+        return None
+
+    def _unindex_membership(self, org_id: str, model_id: int) -> None:
+        org_ids = self._organizations_by_model.get(model_id)
+        if org_ids is not None:
+            org_ids.discard(org_id)
+            if not org_ids:
+                del self._organizations_by_model[model_id]
+
+    def dump(self) -> dict:
+        """Dump the repository state for a snapshot"""
+        return {
+            "next_id": self._next_id,
+            "organizations": [
+                [
+                    org.id,
+                    org.name,
+                    [model.id for model in org.models],
+                    org.default_priority,
+                ]
+                for org in self._organizations.values()
+            ],
+        }
+
+    def restore(self, data: dict, models: ModelRepository) -> None:
+        """Replace the repository state with a dumped one, linking models"""
+        self._organizations = {}
+        self._organizations_by_model = {}
+        for entry in data["organizations"]:
+            org_id, name, model_ids = entry[:3]
+            # Snapshots written before priorities have no default
+            default_priority = entry[3] if len(entry) > 3 else None
+            org_models = [models.get_by_id(model_id) for model_id in model_ids]
+            org_models = [model for model in org_models if model is not None]
+            self._organizations[org_id] = Organization(
+                id=org_id,
+                name=name,
+                models=org_models,
+                default_priority=default_priority,
+            )
+            for model in org_models:
+                self._organizations_by_model.setdefault(model.id, set()).add(
+                    org_id
+                )
+        self._next_id = data["next_id"]
+
 
 class MetricsRepository:
     """Repository for managing invocation metrics and history"""
 
     def __init__(self):
         self._invocation_records: Dict[int, InvocationRecord] = {}
+        # UTC epoch of each record by ID - 1, never decreasing so time ranges
+        # can be binary searched. Record timestamps are naive local time and
+        # jump back on DST changes or clock steps.
+        self._record_times: List[float] = []
         self._model_stats: Dict[str, ModelStats] = {}
         self._next_record_id = 1
 
+    @property
+    def version(self) -> int:
+        """Monotonically increasing version, bumped by every new record"""
+        return self._next_record_id
+
     def record_invocation(
         self,
         model_id: str,
@@ -112,11 +304,18 @@ class MetricsRepository:
         output_size: int = 0,
     ) -> InvocationRecord:
         """Record a new invocation and update model stats"""
+        now = time.time()
+        # A clock stepped back files the record at the latest time seen
+        if self._record_times and now < self._record_times[-1]:
+            self._record_times.append(self._record_times[-1])
+        else:
+            self._record_times.append(now)
+
         # Create invocation record
         record = InvocationRecord(
             id=self._next_record_id,
             model_id=model_id,
-            timestamp=datetime.now(),
+            timestamp=datetime.fromtimestamp(now),
             success=success,
             latency_ms=latency_ms,
             error_log=error_log,
@@ -190,6 +389,43 @@ class MetricsRepository:
 
         return records[start:end]
 
+    def iter_invocation_history(
+        self,
+        model_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        chunk_size: int = 1000,
+    ) -> Iterator[List[InvocationRecord]]:
+        """
+        Iterate invocation history oldest first, without copying or sorting.
+
+        Records get consecutive IDs in arrival order, so the time range is
+        located by binary search over their UTC arrival times. Naive bounds
+        are local time. Records added while iterating are not yielded, the
+        result is a snapshot as of the first chunk.
+
+        Yields:
+            The matching records of every chunk_size records scanned, so a
+            filter matching few records still hands control back regularly.
+            Chunks may be empty.
+        """
+        start = 0
+        if since is not None:
+            start = bisect.bisect_left(self._record_times, since.timestamp())
+        end = len(self._record_times)
+        if until is not None:
+            end = bisect.bisect_left(self._record_times, until.timestamp())
+
+        records = self._invocation_records
+        # Record IDs start at 1
+        for chunk_start in range(start + 1, end + 1, chunk_size):
+            chunk_end = min(chunk_start + chunk_size, end + 1)
+            yield [
+                records[record_id]
+                for record_id in range(chunk_start, chunk_end)
+                if not model_id or records[record_id].model_id == model_id
+            ]
+
     def get_model_stats(
         self, model_id: Optional[str] = None
     ) -> Dict[str, ModelStats]:
@@ -223,21 +459,35 @@ model_repository = ModelRepository()
 organization_repository = OrganizationRepository()
 metrics_repository = MetricsRepository()
 
-# Initialize with some sample data
-sample_org1 = organization_repository.create("Baseten")
-sample_org2 = organization_repository.create("Strawberry")
-
-sample_model1 = model_repository.create("GPT-3.5")
-sample_model2 = model_repository.create("BERT")
-sample_model3 = model_repository.create("ResNet")
-
-# Add some models to organizations
-organization_repository.add_model_to_organization(
-    sample_org1.id, sample_model1
-)
-organization_repository.add_model_to_organization(
-    sample_org1.id, sample_model2
-)
-organization_repository.add_model_to_organization(
-    sample_org2.id, sample_model3
-)
+
+def seed_sample_data() -> bool:
+    """
+    Create the sample organizations and models.
+
+    Seeding is skipped if the repositories already hold state, e.g. from a
+    previous call or a hydrated snapshot.
+
+    Returns:
+        True if the sample data was created
+    """
+    if model_repository.get_all() or organization_repository.get_all():
+        return False
+
+    sample_org1 = organization_repository.create("Baseten")
+    sample_org2 = organization_repository.create("Strawberry")
+
+    sample_model1 = model_repository.create("GPT-3.5")
+    sample_model2 = model_repository.create("BERT")
+    sample_model3 = model_repository.create("ResNet")
+
+    # Add some models to organizations
+    organization_repository.add_model_to_organization(
+        sample_org1.id, sample_model1
+    )
+    organization_repository.add_model_to_organization(
+        sample_org1.id, sample_model2
+    )
+    organization_repository.add_model_to_organization(
+        sample_org2.id, sample_model3
+    )
+    return True
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+from typing import List
+import asyncio
+import json
+import os
+import time
+
+from baseten_backend_take_home.dispatcher import (
+    DEFAULT_PRIORITY,
+    upstream_dispatcher,
+)
+from baseten_backend_take_home.prometheus_metrics import (
+    SHARD_FANOUT,
+    SHARD_REASSEMBLY_LATENCY,
+)
+
+# Inputs of splittable models longer than this are sharded
+SHARD_SIZE = int(os.getenv("SHARD_SIZE", "10000"))
+# Shards of a single request in flight at once
+SHARD_MAX_CONCURRENCY = int(os.getenv("SHARD_MAX_CONCURRENCY", "8"))
+# Checked here so a bad value fails startup rather than every sharded
+# invocation
+if SHARD_SIZE <= 0:
+    raise ValueError(f"SHARD_SIZE must be positive, got {SHARD_SIZE}")
+if SHARD_MAX_CONCURRENCY <= 0:
+    raise ValueError(
+        f"SHARD_MAX_CONCURRENCY must be positive, got {SHARD_MAX_CONCURRENCY}"
+    )
+
+
+class ShardFailed(Exception):
+    """A shard came back unsuccessful, failing the whole invocation."""
+
+    def __init__(self, response_data: dict):
+        super().__init__(response_data.get("error_log") or "Shard failed")
+        self.response_data = response_data
+
+
+def split_input(input: List[int], shard_size: int) -> List[List[int]]:
+    """Split an input into consecutive shards of at most shard_size"""
+    shards = []
+    for start in range(0, len(input), shard_size):
+        end = start + shard_size
+        shards.append(input[start:end])
+    return shards
+
+
+async def _invoke_shard(
+    endpoint,
+    model_id: str,
+    shard: List[int],
+    semaphore: asyncio.Semaphore,
+    priority: str,
+) -> dict:
+    async with semaphore:
+        json_str = json.dumps(
+            {"worklet_input": {"model_id": model_id, "input": shard}}
+        )
+        async with upstream_dispatcher.slot(priority):
+            response = await endpoint.exec(json_str)
+            response_data = await response.json()
+
+    if not response_data.get("success", True):
+        raise ShardFailed(response_data)
+    output = response_data.get("worklet_output") or []
+    if len(output) != len(shard):
+        raise ShardFailed(
+            {
+                **response_data,
+                "success": False,
+                "error_log": f"Shard returned {len(output)} outputs for "
+                f"{len(shard)} inputs",
+            }
+        )
+    return response_data
+
+
+async def invoke_sharded(
+    endpoint,
+    model_id: str,
+    input: List[int],
+    shard_size: int = SHARD_SIZE,
+    max_concurrency: int = SHARD_MAX_CONCURRENCY,
+    priority: str = DEFAULT_PRIORITY,
+) -> dict:
+    """
+    Invoke an element-wise model on shards of its input concurrently.
+
+    The first failing shard cancels the others and fails the whole
+    invocation, exceptions (e.g. network errors) propagate as they are.
+    Every shard is dispatched upstream in the given priority lane.
+
+    Returns:
+        Response data shaped like a single upstream response, with the
+        shard outputs concatenated in input order
+    """
+    shards = split_input(input, shard_size)
+    SHARD_FANOUT.observe(len(shards))
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    tasks = [
+        asyncio.create_task(
+            _invoke_shard(endpoint, model_id, shard, semaphore, priority)
+        )
+        for shard in shards
+    ]
+    try:
+        results = await asyncio.gather(*tasks)
+    except ShardFailed as e:
+        return {
+            "worklet_output": [],
+            "success": False,
+            "latency_ms": e.response_data.get("latency_ms", 0),
+            "error_log": e.response_data.get("error_log") or str(e),
+        }
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    start = time.perf_counter()
+    output: List[int] = []
+    for result in results:
+        output.extend(result["worklet_output"])
+    SHARD_REASSEMBLY_LATENCY.observe(time.perf_counter() - start)
+
+    return {
+        "worklet_output": output,
+        "success": True,
+        # Shards run in parallel, the slowest one is the invocation latency
+        "latency_ms": max(result.get("latency_ms", 0) for result in results),
+        "error_log": "",
+    }
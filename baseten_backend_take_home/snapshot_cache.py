@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+import gzip
+import os
+import uuid
+import zlib
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+# Serialized responses kept, one per endpoint and query
+SNAPSHOT_CACHE_MAX_ENTRIES = int(
+    os.getenv("SNAPSHOT_CACHE_MAX_ENTRIES", "256")
+)
+# Bodies smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = int(os.getenv("METRICS_COMPRESS_MIN_BYTES", "1024"))
+
+# Repository versions restart in every process, so ETags are scoped to this
+# process's lifetime. A tag from a restarted or different replica never
+# matches, even once that replica reaches the same version.
+BOOT_ID = uuid.uuid4().hex[:16]
+
+
+def _zstd_compress(body: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=3).compress(body)
+
+
+def _gzip_compress(body: bytes) -> bytes:
+    return gzip.compress(body, compresslevel=5)
+
+
+# Supported content codings, in order of preference
+ENCODINGS: Dict[str, Callable[[bytes], bytes]] = {}
+if zstandard is not None:
+    ENCODINGS["zstd"] = _zstd_compress
+ENCODINGS["gzip"] = _gzip_compress
+
+
+def etag_for(version: int) -> str:
+    """Weak ETag for a repository version, weak as encodings may differ"""
+    return f'W/"{BOOT_ID}-{version}"'
+
+
+def is_not_modified(request: Optional[Request], etag: str) -> bool:
+    """Check a request's If-None-Match header against an ETag"""
+    if request is None:
+        return False
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison: W/"a-1" matches "a-1"
+    opaque = etag.removeprefix("W/")
+    return any(
+        tag.strip().removeprefix("W/") == opaque for tag in header.split(",")
+    )
+
+
+def not_modified_response(etag: str) -> Response:
+    return Response(
+        status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"}
+    )
+
+
+def accepted_encoding(request: Optional[Request]) -> Optional[str]:
+    """Pick the preferred supported encoding from Accept-Encoding"""
+    if request is None:
+        return None
+    accepted = {
+        coding.split(";")[0].strip().lower()
+        for coding in request.headers.get("accept-encoding", "").split(",")
+    }
+    for encoding in ENCODINGS:
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+class StreamCompressor:
+    """Incremental compressor for streamed response bodies."""
+
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        elif encoding == "gzip":
+            # wbits=31 writes a gzip header and trailer
+            self._compressor = zlib.compressobj(5, zlib.DEFLATED, 31)
+        else:
+            raise ValueError(f"Unsupported encoding: {encoding}")
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+
+class Snapshot:
+    """A serialized JSON response for one repository version."""
+
+    def __init__(self, version: int, body: bytes):
+        self.version = version
+        self.etag = etag_for(version)
+        self.body = body
+        self._encoded: Dict[str, bytes] = {}
+
+    def encoded(self, encoding: str) -> bytes:
+        """Get the body in a content coding, compressing it on first use"""
+        body = self._encoded.get(encoding)
+        if body is None:
+            body = ENCODINGS[encoding](self.body)
+            self._encoded[encoding] = body
+        return body
+
+    def response(self, request: Optional[Request] = None) -> Response:
+        """Build a response, compressed if large and the client accepts it"""
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        body = self.body
+        encoding = accepted_encoding(request)
+        if encoding is not None and len(body) >= COMPRESS_MIN_BYTES:
+            body = self.encoded(encoding)
+            headers["Content-Encoding"] = encoding
+        return Response(
+            content=body, media_type="application/json", headers=headers
+        )
+
+
+class SnapshotCache:
+    """LRU of serialized responses keyed by query, valid for one version."""
+
+    def __init__(self, max_entries: int = SNAPSHOT_CACHE_MAX_ENTRIES):
+        self._snapshots: "OrderedDict[Hashable, Snapshot]" = OrderedDict()
+        self._max_entries = max_entries
+
+    def get(self, key: Hashable, version: int) -> Optional[Snapshot]:
+        """Get the snapshot for a query if it was built at this version"""
+        snapshot = self._snapshots.get(key)
+        if snapshot is None or snapshot.version != version:
+            return None
+        self._snapshots.move_to_end(key)
+        return snapshot
+
+    def put(self, key: Hashable, version: int, body: bytes) -> Snapshot:
+        """Store a freshly serialized response"""
+        snapshot = Snapshot(version, body)
+        self._snapshots[key] = snapshot
+        self._snapshots.move_to_end(key)
+        while len(self._snapshots) > self._max_entries:
+            self._snapshots.popitem(last=False)
+        return snapshot
+
+    def clear(self) -> None:
+        self._snapshots.clear()
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+
+# Global snapshot cache instance
+snapshot_cache = SnapshotCache()
@@ -12,7 +12,7 @@ def test_invoke_endpoint():
     # Define the request payload based on the InvokeRequest model
     payload = {
         "worklet_input": {
-            "model_id": "test_model_123",
+            "model_id": "gpt-3.5",
             "input": [1, 2, 3, 4, 5],
         }
     }
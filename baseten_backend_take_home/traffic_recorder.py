@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+from typing import List, Optional
+import json
+import logging
+import os
+import queue
+import random
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Capture is disabled unless a path is configured
+TRAFFIC_CAPTURE_PATH = os.getenv("TRAFFIC_CAPTURE_PATH")
+TRAFFIC_CAPTURE_SAMPLE_RATE = float(
+    os.getenv("TRAFFIC_CAPTURE_SAMPLE_RATE", "1.0")
+)
+# Records waiting to be written, records past this are dropped rather than
+# slowing down /invoke
+TRAFFIC_CAPTURE_BUFFER = int(os.getenv("TRAFFIC_CAPTURE_BUFFER", "10000"))
+TRAFFIC_CAPTURE_FLUSH_SECONDS = float(
+    os.getenv("TRAFFIC_CAPTURE_FLUSH_SECONDS", "1.0")
+)
+
+
+class TrafficRecorder:
+    """
+    Appends a sample of /invoke requests and their outcome to a JSONL file.
+
+    record() only enqueues, a background thread batches the records and
+    writes them, so the event loop never touches the file.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = TRAFFIC_CAPTURE_PATH,
+        sample_rate: float = TRAFFIC_CAPTURE_SAMPLE_RATE,
+        buffer_size: int = TRAFFIC_CAPTURE_BUFFER,
+        flush_interval: float = TRAFFIC_CAPTURE_FLUSH_SECONDS,
+    ):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue(buffer_size)
+        self._writer: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and self.sample_rate > 0
+
+    def sample(self) -> bool:
+        """Decide whether the current request should be recorded"""
+        return self.enabled and (
+            self.sample_rate >= 1 or random.random() < self.sample_rate
+        )
+
+    def record(
+        self,
+        arrival: float,
+        model_id: str,
+        input: List[int],
+        outcome: str,
+        served_by: str,
+        gateway_latency_ms: float,
+        upstream_latency_ms: Optional[int] = None,
+        error_log: str = "",
+        worklet_output: Optional[List[int]] = None,
+    ) -> None:
+        """
+        Queue a record for writing.
+
+        Args:
+            arrival: Epoch seconds the request arrived at
+            model_id: Requested model_id
+            input: Worklet input
+            outcome: "success", "failure" or "error"
+            served_by: "upstream", "negative_cache" or "rejected"
+            gateway_latency_ms: Time spent in the handler
+            upstream_latency_ms: latency_ms reported by the upstream
+            error_log: Error message, if any
+            worklet_output: Output returned to the client, if any
+        """
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(
+                {
+                    "arrival": arrival,
+                    "model_id": model_id,
+                    "input": input,
+                    "outcome": outcome,
+                    "served_by": served_by,
+                    "gateway_latency_ms": gateway_latency_ms,
+                    "upstream_latency_ms": upstream_latency_ms,
+                    "error_log": error_log,
+                    "worklet_output": worklet_output,
+                }
+            )
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        """Flush pending records and stop the writer"""
+        if self._writer is None:
+            return
+        self._queue.put(None)
+        self._writer.join()
+        self._writer = None
+
+    def _ensure_writer(self) -> None:
+        if self._writer is None:
+            self._writer = threading.Thread(
+                target=self._write, name="traffic-recorder", daemon=True
+            )
+            self._writer.start()
+
+    def _write(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while True:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if None in batch:
+                stopping = True
+                batch = [record for record in batch if record is not None]
+            if not batch:
+                continue
+            try:
+                with open(self.path, "a") as f:
+                    f.writelines(
+                        json.dumps(record, separators=(",", ":")) + "\n"
+                        for record in batch
+                    )
+            except OSError:
+                logger.exception("Could not write captured traffic")
+
+
+traffic_recorder = TrafficRecorder()
@@ -0,0 +1 @@
+# Benchmarks for the baseten_backend_take_home gateway
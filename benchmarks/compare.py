@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+Compare two invoke_load reports and flag regressions.
+
+A level regresses when its p50/p99/p999 latency grows, or its throughput
+drops, by more than the threshold percentage, or when its error rate
+grows by more than the error threshold in percentage points. Exits with
+status 1 if any level regressed.
+
+Usage:
+    poetry run python -m benchmarks.compare base.json new.json \\
+        --threshold 10 --error-threshold 1
+"""
+import argparse
+import json
+import sys
+
+
+def level_key(result: dict) -> tuple:
+    return (result["rps"], result["concurrency"])
+
+
+def change(base, new) -> float:
+    """Relative change in percent, 0 when there is nothing to compare"""
+    if not base or new is None:
+        return 0.0
+    return (new - base) / base * 100
+
+
+def compare(
+    base: dict, new: dict, threshold: float, error_threshold: float = 1.0
+) -> dict:
+    base_levels = {level_key(r): r for r in base["results"]}
+    levels = []
+    for result in new["results"]:
+        previous = base_levels.get(level_key(result))
+        if previous is None:
+            continue
+        deltas = {
+            quantile: change(
+                previous["latency_ms"][quantile],
+                result["latency_ms"][quantile],
+            )
+            for quantile in ("p50", "p99", "p999")
+        }
+        deltas["throughput_rps"] = change(
+            previous["throughput_rps"], result["throughput_rps"]
+        )
+        # Error rates are fractions, compared in percentage points
+        base_errors = previous["error_rate"] * 100
+        new_errors = result["error_rate"] * 100
+        error_rate = {
+            "base_pct": base_errors,
+            "new_pct": new_errors,
+            "change_pp": new_errors - base_errors,
+        }
+        regressed = (
+            any(deltas[q] > threshold for q in ("p50", "p99", "p999"))
+            or deltas["throughput_rps"] < -threshold
+            or error_rate["change_pp"] > error_threshold
+        )
+        levels.append(
+            {
+                "rps": result["rps"],
+                "concurrency": result["concurrency"],
+                "change_pct": deltas,
+                "error_rate": error_rate,
+                "regressed": regressed,
+            }
+        )
+    return {
+        "base_revision": base.get("revision"),
+        "new_revision": new.get("revision"),
+        "threshold_pct": threshold,
+        "error_threshold_pp": error_threshold,
+        "levels": levels,
+        "regressed": any(level["regressed"] for level in levels),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    parser.add_argument(
+        "--error-threshold",
+        type=float,
+        default=1.0,
+        help="Allowed error rate increase in percentage points",
+    )
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    report = compare(base, new, args.threshold, args.error_threshold)
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report["regressed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+"""
+Open-loop load benchmark for the /invoke endpoint.
+
+Starts the async mock upstream in this process and the gateway in a
+subprocess pointed at it, then drives /invoke at every combination of the
+requested RPS and concurrency levels. Requests are sent on a fixed
+schedule whether or not earlier ones completed, and latency is measured
+from the scheduled send time, so a slow gateway shows up as latency
+instead of silently lowering the offered load.
+
+Usage:
+    poetry run python -m benchmarks.invoke_load --rps 50,200 \\
+        --concurrency 16,64 --duration 10 --latency lognormal:50:0.5 \\
+        --failure-rate 0.05 --seed 42 --output bench.json
+"""
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+from benchmarks.mock_upstream import (
+    ERROR_MIXES,
+    MockUpstream,
+    MockUpstreamConfig,
+)
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))
+    return sorted_values[index]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def start_gateway(
+    port: int, upstream_port: int, env: Optional[Dict[str, str]] = None
+) -> subprocess.Popen:
+    """Start the gateway with uvicorn and wait until /healtz answers"""
+    env = {
+        **os.environ,
+        "MOCK_SERVER_URL": f"http://127.0.0.1:{upstream_port}",
+        **(env or {}),
+    }
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "baseten_backend_take_home.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        env=env,
+    )
+    async with aiohttp.ClientSession() as session:
+        for _ in range(200):
+            if process.poll() is not None:
+                raise RuntimeError("Gateway exited during startup")
+            try:
+                async with session.get(
+                    f"http://127.0.0.1:{port}/healtz"
+                ) as response:
+                    if response.status == 200:
+                        return process
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.05)
+    process.terminate()
+    raise RuntimeError("Gateway did not become healthy")
+
+
+async def run_level(
+    url: str,
+    rps: float,
+    concurrency: int,
+    duration: float,
+    payload: dict,
+) -> dict:
+    """Drive one RPS/concurrency level and summarize it"""
+    latencies: List[float] = []
+    failures = 0
+    errors = 0
+    body = json.dumps(payload)
+    headers = {"content-type": "application/json"}
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+
+        async def send(scheduled: float):
+            nonlocal failures, errors
+            try:
+                async with session.post(
+                    url, data=body, headers=headers
+                ) as response:
+                    data = await response.json()
+                    if response.status != 200:
+                        errors += 1
+                        return
+                    if not data.get("success"):
+                        failures += 1
+            except (aiohttp.ClientError, ValueError):
+                errors += 1
+                return
+            latencies.append((time.perf_counter() - scheduled) * 1000)
+
+        total = int(rps * duration)
+        tasks = []
+        start = time.perf_counter()
+        for i in range(total):
+            scheduled = start + i / rps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    completed = len(latencies)
+    return {
+        "rps": rps,
+        "concurrency": concurrency,
+        "duration_s": elapsed,
+        "sent": total,
+        "completed": completed,
+        "throughput_rps": completed / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p99": percentile(latencies, 99),
+            "p999": percentile(latencies, 99.9),
+            "max": latencies[-1] if latencies else None,
+        },
+        "upstream_failures": failures,
+        "errors": errors,
+        "error_rate": errors / total if total else 0.0,
+        "failure_rate": failures / total if total else 0.0,
+    }
+
+
+async def run(args) -> dict:
+    upstream = MockUpstream(
+        MockUpstreamConfig(
+            latency=args.latency,
+            failure_rate=args.failure_rate,
+            errors=args.errors,
+            seed=args.seed,
+        )
+    )
+    upstream_port = await upstream.start()
+    gateway_port = free_port()
+    gateway = await start_gateway(gateway_port, upstream_port)
+    url = f"http://127.0.0.1:{gateway_port}/invoke"
+    payload = {
+        "worklet_input": {
+            "model_id": args.model_id,
+            "input": list(range(args.input_size)),
+        }
+    }
+
+    results = []
+    try:
+        for rps in args.rps:
+            for concurrency in args.concurrency:
+                results.append(
+                    await run_level(
+                        url, rps, concurrency, args.duration, payload
+                    )
+                )
+    finally:
+        gateway.terminate()
+        gateway.wait()
+        await upstream.stop()
+
+    return {
+        "benchmark": "invoke_load",
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "config": {
+            "model_id": args.model_id,
+            "input_size": args.input_size,
+            "duration_s": args.duration,
+            "upstream_latency": args.latency,
+            "upstream_failure_rate": args.failure_rate,
+            "upstream_errors": args.errors,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+def parse_list(value: str, cast=int) -> list:
+    return [cast(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--rps", type=lambda v: parse_list(v, float), default=[50.0]
+    )
+    parser.add_argument("--concurrency", type=parse_list, default=[32])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--latency", default="lognormal:50:0.5")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--errors", choices=sorted(ERROR_MIXES), default="transient"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--model-id", default="GPT-3.5")
+    parser.add_argument("--input-size", type=int, default=5)
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
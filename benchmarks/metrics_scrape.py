@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""
+Benchmark /metrics scrape cost and label lookup cost versus model_id
+cardinality.
+
+Builds the gateway's metric families in a private registry, populates them
+with one series per model_id and times generate_latest(). The "unbounded"
+scenario is what a client sending random model_ids produces, the "bounded"
+one is the same traffic folded into METRICS_MAX_MODEL_LABELS labels plus
+the overflow bucket.
+
+Usage:
+    poetry run python -m benchmarks.metrics_scrape --models 10000
+"""
+import argparse
+import json
+import statistics
+import time
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+
+from baseten_backend_take_home.prometheus_metrics import (
+    MAX_MODEL_LABELS,
+    OTHER_MODEL_LABEL,
+)
+
+
+def build_families(registry: CollectorRegistry) -> dict:
+    """Mirror the metric families of prometheus_metrics in a registry"""
+    return {
+        "counter": Counter(
+            "model_invocations_total",
+            "Total number of model invocations",
+            ["model_id", "status"],
+            registry=registry,
+        ),
+        "latency": Histogram(
+            "model_invocation_latency_seconds",
+            "Latency of model invocations in seconds",
+            ["model_id"],
+            buckets=[0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0],
+            registry=registry,
+        ),
+        "active": Gauge(
+            "model_active_invocations",
+            "Number of active model invocations",
+            ["model_id"],
+            registry=registry,
+        ),
+        "total": Gauge(
+            "model_total_invocations",
+            "Total number of invocations per model",
+            ["model_id"],
+            registry=registry,
+        ),
+        "success_rate": Gauge(
+            "model_success_rate",
+            "Success rate of model invocations as percentage",
+            ["model_id"],
+            registry=registry,
+        ),
+    }
+
+
+def populate(families: dict, labels: list) -> None:
+    """Create one child per label value in every family"""
+    for label in labels:
+        families["counter"].labels(model_id=label, status="success").inc()
+        families["counter"].labels(model_id=label, status="failure").inc()
+        families["latency"].labels(model_id=label).observe(0.2)
+        families["active"].labels(model_id=label).set(0)
+        families["total"].labels(model_id=label).set(1)
+        families["success_rate"].labels(model_id=label).set(100)
+
+
+def time_scrape(registry: CollectorRegistry, repeat: int) -> dict:
+    """Time generate_latest() on a registry"""
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        size = len(generate_latest(registry))
+        timings.append((time.perf_counter_ns() - start) / 1e6)
+    return {
+        "scrape_ms_median": statistics.median(timings),
+        "scrape_ms_max": max(timings),
+        "scrape_bytes": size,
+    }
+
+
+def time_lookup(families: dict, label: str, iterations: int) -> dict:
+    """Compare a .labels() lookup per call with a pre-bound child"""
+    counter = families["counter"]
+
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        counter.labels(model_id=label, status="success").inc()
+    labels_ns = (time.perf_counter_ns() - start) / iterations
+
+    child = counter.labels(model_id=label, status="success")
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        child.inc()
+    bound_ns = (time.perf_counter_ns() - start) / iterations
+
+    return {"labels_call_ns": labels_ns, "pre_bound_ns": bound_ns}
+
+
+def run(models: int, max_labels: int, repeat: int, iterations: int) -> dict:
+    raw_labels = [f"model-{i}" for i in range(models)]
+    results = {"models": models, "max_labels": max_labels}
+
+    unbounded = CollectorRegistry()
+    families = build_families(unbounded)
+    populate(families, raw_labels)
+    results["unbounded"] = time_scrape(unbounded, repeat)
+    results["lookup"] = time_lookup(families, raw_labels[0], iterations)
+
+    bounded = CollectorRegistry()
+    populate(
+        build_families(bounded),
+        raw_labels[:max_labels] + [OTHER_MODEL_LABEL],
+    )
+    results["bounded"] = time_scrape(bounded, repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--models", type=int, default=10000)
+    parser.add_argument("--max-labels", type=int, default=MAX_MODEL_LABELS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(
+        json.dumps(
+            run(args.models, args.max_labels, args.repeat, args.iterations),
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""
+Async mock worklet upstream with a configurable, reproducible behaviour.
+
+Unlike worklet_mock_server it never blocks the event loop, and latency,
+failure rate and error mix are drawn from a seeded RNG so two runs with the
+same seed and request order see the same upstream.
+
+Usage:
+    poetry run python -m benchmarks.mock_upstream --port 8001 \\
+        --latency lognormal:50:0.5 --failure-rate 0.1 --errors all --seed 42
+"""
+from dataclasses import dataclass
+from typing import Callable, Optional
+import argparse
+import asyncio
+import math
+import random
+
+from aiohttp import web
+
+TRANSIENT_ERRORS = [
+    "There was a Network error while calling the model",
+]
+
+# Deterministic errors end up in the gateway's negative cache, so they are
+# only produced when asked for
+ERROR_MIXES = {
+    "transient": TRANSIENT_ERRORS,
+    "all": TRANSIENT_ERRORS
+    + [
+        "Model {model_id} is not deployed",
+        "Model {model_id} does not exist",
+    ],
+}
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Parse a latency distribution spec into a sampler returning milliseconds.
+
+    Supported specs:
+        constant:MS
+        uniform:LOW_MS:HIGH_MS
+        exponential:MEAN_MS
+        lognormal:MEDIAN_MS:SIGMA
+    """
+    kind, *params = spec.split(":")
+    try:
+        values = [float(p) for p in params]
+        if kind == "constant":
+            (ms,) = values
+            return lambda rng: ms
+        if kind == "uniform":
+            low, high = values
+            return lambda rng: rng.uniform(low, high)
+        if kind == "exponential":
+            (mean,) = values
+            return lambda rng: rng.expovariate(1 / mean) if mean else 0.0
+        if kind == "lognormal":
+            median, sigma = values
+            mu = math.log(median)
+            return lambda rng: rng.lognormvariate(mu, sigma)
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+@dataclass
+class MockUpstreamConfig:
+    latency: str = "constant:0"
+    failure_rate: float = 0.0
+    errors: str = "transient"
+    seed: Optional[int] = None
+
+
+class MockUpstream:
+    """aiohttp application serving POST /invoke like the worklet."""
+
+    def __init__(self, config: MockUpstreamConfig):
+        self.config = config
+        self._rng = random.Random(config.seed)
+        self._sample_latency = parse_latency(config.latency)
+        self._errors = ERROR_MIXES[config.errors]
+        self.requests = 0
+        self.app = web.Application()
+        self.app.router.add_post("/invoke", self.invoke)
+        self.app.router.add_get("/healtz", self.health_check)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def invoke(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        worklet_input = body["worklet_input"]
+        self.requests += 1
+
+        # Draw everything up front so the sequence only depends on the
+        # order requests arrive in
+        latency_ms = max(0.0, self._sample_latency(self._rng))
+        failed = self._rng.random() < self.config.failure_rate
+        error = self._rng.choice(self._errors)
+
+        await asyncio.sleep(latency_ms / 1000)
+
+        if failed:
+            return web.json_response(
+                {
+                    "latency_ms": round(latency_ms),
+                    "success": False,
+                    "error_log": error.format(
+                        model_id=worklet_input["model_id"]
+                    ),
+                    "worklet_output": [],
+                }
+            )
+        return web.json_response(
+            {
+                "latency_ms": round(latency_ms),
+                "success": True,
+                "error_log": "",
+                "worklet_output": [
+                    int(x * 2 / 3) for x in worklet_input["input"]
+                ],
+            }
+        )
+
+    async def health_check(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {"status": "healthy", "service": "benchmark-mock-upstream"}
+        )
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        """Start serving, returns the bound port"""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        return self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", default="constant:0")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--errors", choices=sorted(ERROR_MIXES), default="transient"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    upstream = MockUpstream(
+        MockUpstreamConfig(
+            latency=args.latency,
+            failure_rate=args.failure_rate,
+            errors=args.errors,
+            seed=args.seed,
+        )
+    )
+    web.run_app(upstream.app, host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
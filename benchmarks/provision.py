@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""
+Provisioning benchmark for the GraphQL bulk mutations.
+
+Starts the gateway in a subprocess and times creating N models attached
+to an organization with one createModels call, attaching them to a
+second organization with addModelsToOrganization and detaching them again
+with removeModelsFromOrganization. For comparison, --baseline M times M
+createModel + addModelToOrganization round trips.
+
+Usage:
+    poetry run python -m benchmarks.provision --models 10000 \\
+        --baseline 500 --output provision.json
+"""
+from typing import Optional
+import argparse
+import asyncio
+import json
+import platform
+import time
+
+import aiohttp
+
+from benchmarks.invoke_load import free_port, git_revision, start_gateway
+
+CREATE_ORGANIZATION = """
+mutation($name: String!) { createOrganization(name: $name) { id } }
+"""
+CREATE_MODELS = """
+mutation($models: [ModelInput!]!, $org: String) {
+  createModels(models: $models, organizationId: $org) { id }
+}
+"""
+ADD_MODELS = """
+mutation($org: String!, $ids: [Int!]!) {
+  addModelsToOrganization(organizationId: $org, modelIds: $ids)
+}
+"""
+REMOVE_MODELS = """
+mutation($org: String!, $ids: [Int!]!) {
+  removeModelsFromOrganization(organizationId: $org, modelIds: $ids)
+}
+"""
+CREATE_MODEL = """
+mutation($name: String!) { createModel(name: $name) { id } }
+"""
+ADD_MODEL = """
+mutation($org: String!, $id: Int!) {
+  addModelToOrganization(organizationId: $org, modelId: $id)
+}
+"""
+
+
+async def graphql(
+    session: aiohttp.ClientSession, url: str, query: str, variables: dict
+) -> dict:
+    async with session.post(
+        url, json={"query": query, "variables": variables}
+    ) as response:
+        body = await response.json()
+    if body.get("errors"):
+        raise RuntimeError(body["errors"][0]["message"])
+    return body["data"]
+
+
+async def timed(coro) -> tuple:
+    start = time.perf_counter()
+    result = await coro
+    return result, (time.perf_counter() - start) * 1000
+
+
+async def run_baseline(
+    session: aiohttp.ClientSession, url: str, org_id: str, count: int
+) -> Optional[dict]:
+    if count <= 0:
+        return None
+    start = time.perf_counter()
+    for i in range(count):
+        data = await graphql(
+            session, url, CREATE_MODEL, {"name": f"baseline-{i}"}
+        )
+        await graphql(
+            session,
+            url,
+            ADD_MODEL,
+            {"org": org_id, "id": data["createModel"]["id"]},
+        )
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return {
+        "models": count,
+        "elapsed_ms": elapsed_ms,
+        "per_model_ms": elapsed_ms / count,
+    }
+
+
+async def run(args) -> dict:
+    port = free_port()
+    # Nothing is invoked, the upstream is never called
+    gateway = await start_gateway(port, free_port())
+    url = f"http://127.0.0.1:{port}/graphql"
+    models = [
+        {"name": f"bench-{i}", "splittable": False} for i in range(args.models)
+    ]
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            orgs = []
+            for name in ("bench-primary", "bench-secondary"):
+                data = await graphql(
+                    session, url, CREATE_ORGANIZATION, {"name": name}
+                )
+                orgs.append(data["createOrganization"]["id"])
+            data, create_ms = await timed(
+                graphql(
+                    session,
+                    url,
+                    CREATE_MODELS,
+                    {"models": models, "org": orgs[0]},
+                )
+            )
+            ids = [model["id"] for model in data["createModels"]]
+            _, add_ms = await timed(
+                graphql(session, url, ADD_MODELS, {"org": orgs[1], "ids": ids})
+            )
+            _, remove_ms = await timed(
+                graphql(
+                    session, url, REMOVE_MODELS, {"org": orgs[1], "ids": ids}
+                )
+            )
+            baseline = await run_baseline(session, url, orgs[1], args.baseline)
+    finally:
+        gateway.terminate()
+        gateway.wait()
+
+    return {
+        "benchmark": "provision",
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "config": {"models": args.models, "baseline": args.baseline},
+        "results": {
+            "create_models_ms": create_ms,
+            "add_models_ms": add_ms,
+            "remove_models_ms": remove_ms,
+            "baseline": baseline,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--models", type=int, default=10000)
+    parser.add_argument(
+        "--baseline",
+        type=int,
+        default=0,
+        help="Models to provision one round trip at a time, 0 to skip",
+    )
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+"""
+Replay traffic captured with TRAFFIC_CAPTURE_PATH against a gateway.
+
+Requests are sent in recorded order with the recorded inter-arrival gaps
+divided by --speed (or back to back with --speed max), which keeps the
+per-model mix and burstiness of the capture.
+
+With --stub-upstream a local gateway is started against an in-process stub
+upstream that answers every request with its recorded response and
+upstream latency, so an incident can be reproduced without the real
+worklet. Requests the gateway shards are answered shard by shard from the
+matching slice of the recorded output. That gateway starts with only the
+sample models, so it forwards unknown model ids instead of rejecting them.
+The report then also says how many requests the gateway served without
+calling the upstream at all, split into negative cache hits (its hit
+rate) and local rejections.
+
+Usage:
+    poetry run python -m benchmarks.replay capture.jsonl --speed 10 \\
+        --stub-upstream --output replay.json
+    poetry run python -m benchmarks.replay capture.jsonl --speed max \\
+        --target http://localhost:8000
+"""
+from collections import Counter, defaultdict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import json
+import time
+
+import aiohttp
+from aiohttp import web
+from prometheus_client.parser import text_string_to_metric_families
+
+from baseten_backend_take_home.sharding import SHARD_SIZE, split_input
+from benchmarks.invoke_load import free_port, percentile, start_gateway
+
+
+def load_capture(path: str) -> List[dict]:
+    """Load a capture, ordered by arrival"""
+    with open(path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    records.sort(key=lambda record: record["arrival"])
+    return records
+
+
+# A recorded request, the offset of a shard in its input and its shard count
+ShardEntry = Tuple[dict, int, int]
+
+
+def request_key(model_id: str, input: List[int]) -> Tuple[str, tuple]:
+    return (model_id, tuple(input))
+
+
+class StubUpstream:
+    """Answers /invoke with the recorded responses, in recorded order."""
+
+    def __init__(
+        self,
+        records: List[dict],
+        speed: Optional[float],
+        shard_size: int = SHARD_SIZE,
+    ):
+        self.speed = speed
+        self.requests = 0
+        # Gateway requests that reached the upstream, a shard counts as
+        # its share of the request it belongs to
+        self.invocations = 0.0
+        self.unmatched = 0
+        self._responses: Dict[tuple, Deque[dict]] = defaultdict(deque)
+        self._shards: Dict[tuple, Deque[ShardEntry]] = defaultdict(deque)
+        for record in records:
+            # Only replay what the upstream actually answered
+            if (
+                record["outcome"] == "error"
+                or record.get("served_by", "upstream") != "upstream"
+            ):
+                continue
+            key = request_key(record["model_id"], record["input"])
+            self._responses[key].append(record)
+            # The gateway calls a splittable model once per shard instead
+            shards = split_input(record["input"], shard_size)
+            if len(shards) > 1:
+                for i, shard in enumerate(shards):
+                    key = request_key(record["model_id"], shard)
+                    self._shards[key].append(
+                        (record, i * shard_size, len(shards))
+                    )
+        self.app = web.Application()
+        self.app.router.add_post("/invoke", self.invoke)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def invoke(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        worklet_input = (await request.json())["worklet_input"]
+        key = request_key(worklet_input["model_id"], worklet_input["input"])
+        if self._responses.get(key):
+            record = self._next(self._responses[key])
+            output = record.get("worklet_output") or []
+            self.invocations += 1
+        elif self._shards.get(key):
+            record, start, count = self._next(self._shards[key])
+            end = start + len(worklet_input["input"])
+            output = (record.get("worklet_output") or [])[start:end]
+            self.invocations += 1 / count
+        else:
+            self.unmatched += 1
+            return web.json_response(
+                {
+                    "latency_ms": 0,
+                    "success": False,
+                    "error_log": "No recorded response for this request",
+                    "worklet_output": [],
+                }
+            )
+        latency_ms = record.get("upstream_latency_ms") or 0
+        if self.speed:
+            await asyncio.sleep(latency_ms / 1000 / self.speed)
+        return web.json_response(
+            {
+                "latency_ms": latency_ms,
+                "success": record["outcome"] == "success",
+                "error_log": record.get("error_log") or "",
+                "worklet_output": output,
+            }
+        )
+
+    @staticmethod
+    def _next(recorded: deque):
+        # Reuse the last response when the gateway calls more often than
+        # the recording did (e.g. a cache was disabled)
+        return recorded.popleft() if len(recorded) > 1 else recorded[0]
+
+    async def start(self) -> int:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        return self._runner.addresses[0][1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def replay(
+    records: List[dict], url: str, speed: Optional[float], concurrency: int
+) -> dict:
+    """Send the recorded requests to url, preserving their timing"""
+    latencies: List[float] = []
+    outcomes = Counter()
+    mismatches = 0
+    errors = 0
+    per_model = Counter(record["model_id"] for record in records)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+
+        async def send(record: dict, scheduled: float):
+            nonlocal mismatches, errors
+            payload = {
+                "worklet_input": {
+                    "model_id": record["model_id"],
+                    "input": record["input"],
+                }
+            }
+            try:
+                async with session.post(url, json=payload) as response:
+                    data = await response.json()
+                    if response.status != 200:
+                        outcome = "error"
+                    elif data.get("success"):
+                        outcome = "success"
+                    else:
+                        outcome = "failure"
+            except (aiohttp.ClientError, ValueError):
+                errors += 1
+                return
+            latencies.append((time.perf_counter() - scheduled) * 1000)
+            outcomes[outcome] += 1
+            if outcome != record["outcome"]:
+                mismatches += 1
+
+        tasks = []
+        first_arrival = records[0]["arrival"] if records else 0.0
+        start = time.perf_counter()
+        for record in records:
+            scheduled = start
+            if speed:
+                scheduled += (record["arrival"] - first_arrival) / speed
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                scheduled = time.perf_counter()
+            tasks.append(asyncio.create_task(send(record, scheduled)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "sent": len(records),
+        "completed": len(latencies),
+        "duration_s": elapsed,
+        "recorded_duration_s": (
+            records[-1]["arrival"] - first_arrival if records else 0.0
+        ),
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p99": percentile(latencies, 99),
+            "p999": percentile(latencies, 99.9),
+        },
+        "per_model": dict(per_model),
+        "outcomes": dict(outcomes),
+        "outcome_mismatches": mismatches,
+        "errors": errors,
+    }
+
+
+async def local_outcomes(url: str) -> Counter:
+    """Invocations a gateway answered without the upstream, by status"""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            text = await response.text()
+    outcomes = Counter()
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            status = sample.labels.get("status")
+            if sample.name == "model_invocations_total" and status in (
+                "negative_cache_hit",
+                "rejected",
+            ):
+                outcomes[status] += int(sample.value)
+    return outcomes
+
+
+async def run(args) -> dict:
+    records = load_capture(args.capture)
+    speed = None if args.speed == "max" else float(args.speed)
+
+    if not args.stub_upstream:
+        report = await replay(
+            records, f"{args.target}/invoke", speed, args.concurrency
+        )
+        return {"capture": args.capture, "speed": args.speed, **report}
+
+    stub = StubUpstream(records, speed)
+    gateway_port = free_port()
+    # The capture's models are not in the fresh registry, forward them all
+    gateway = await start_gateway(
+        gateway_port, await stub.start(), {"VALIDATE_MODEL_IDS": "false"}
+    )
+    gateway_url = f"http://127.0.0.1:{gateway_port}"
+    try:
+        report = await replay(
+            records, f"{gateway_url}/invoke", speed, args.concurrency
+        )
+        local = await local_outcomes(f"{gateway_url}/metrics")
+    finally:
+        gateway.terminate()
+        gateway.wait()
+        await stub.stop()
+
+    served_locally = max(0, report["completed"] - round(stub.invocations))
+    report["upstream"] = {
+        "requests": stub.requests,
+        "unmatched": stub.unmatched,
+        "served_without_upstream": served_locally,
+        "negative_cache_hits": local["negative_cache_hit"],
+        "rejected": local["rejected"],
+        "hit_rate": (
+            local["negative_cache_hit"] / report["completed"]
+            if report["completed"]
+            else 0.0
+        ),
+    }
+    return {"capture": args.capture, "speed": args.speed, **report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("capture", help="JSONL file written by the recorder")
+    parser.add_argument(
+        "--speed",
+        default="1",
+        help="Replay speed multiplier, or 'max' to ignore recorded gaps",
+    )
+    parser.add_argument("--concurrency", type=int, default=100)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--target", default="http://localhost:8000")
+    target.add_argument(
+        "--stub-upstream",
+        action="store_true",
+        help="Start a local gateway against recorded upstream responses",
+    )
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+"""
+Cold start benchmark for the gateway.
+
+Each run measures, in fresh processes:
+  - import: time to import baseten_backend_take_home.main
+  - readiness: time from spawning uvicorn until /healtz answers 200
+  - first requests: latency of the first /invoke and /graphql requests
+    sent right after readiness, and of a second one for comparison
+
+The mock upstream runs in this process. Extra environment variables for
+the gateway, e.g. to compare WARM_UP_ENABLED=false, are passed with --env.
+
+Usage:
+    poetry run python -m benchmarks.startup --runs 5 \\
+        --env WARM_UP_ENABLED=false --output startup.json
+"""
+from typing import Dict, List
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+from benchmarks.invoke_load import free_port, git_revision
+from benchmarks.mock_upstream import MockUpstream, MockUpstreamConfig
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); "
+    "import baseten_backend_take_home.main; "
+    "print((time.perf_counter() - start) * 1000)"
+)
+
+GRAPHQL_QUERY = {"query": "{ models { id name } }"}
+
+
+def measure_import(env: Dict[str, str]) -> float:
+    """Import time of the app module in a fresh interpreter, in ms"""
+    output = subprocess.check_output(
+        [sys.executable, "-c", IMPORT_SNIPPET], env=env, text=True
+    )
+    return float(output.strip().splitlines()[-1])
+
+
+async def wait_ready(
+    session: aiohttp.ClientSession,
+    process: subprocess.Popen,
+    url: str,
+    timeout: float = 30.0,
+) -> None:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Gateway exited during startup")
+        try:
+            async with session.get(url) as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.005)
+    raise RuntimeError("Gateway did not become healthy")
+
+
+async def timed_request(
+    session: aiohttp.ClientSession, url: str, payload: dict
+) -> float:
+    """Latency of one POST in ms, raising if it did not succeed"""
+    start = time.perf_counter()
+    async with session.post(url, json=payload) as response:
+        await response.read()
+        response.raise_for_status()
+    return (time.perf_counter() - start) * 1000
+
+
+async def measure_run(env: Dict[str, str], model_id: str) -> dict:
+    """Spawn the gateway once and time readiness and the first requests"""
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    invoke_payload = {"worklet_input": {"model_id": model_id, "input": [1]}}
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "baseten_backend_take_home.main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        env=env,
+    )
+    try:
+        async with aiohttp.ClientSession() as session:
+            await wait_ready(session, process, f"{base_url}/healtz")
+            readiness_ms = (time.perf_counter() - start) * 1000
+
+            result = {"readiness_ms": readiness_ms}
+            for name, path, payload in (
+                ("invoke", "/invoke", invoke_payload),
+                ("graphql", "/graphql", GRAPHQL_QUERY),
+            ):
+                url = f"{base_url}{path}"
+                result[f"first_{name}_ms"] = await timed_request(
+                    session, url, payload
+                )
+                result[f"second_{name}_ms"] = await timed_request(
+                    session, url, payload
+                )
+            return result
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def summarize(samples: List[float]) -> dict:
+    return {
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+        "samples": samples,
+    }
+
+
+async def run(args) -> dict:
+    upstream = MockUpstream(MockUpstreamConfig(latency="constant:0"))
+    upstream_port = await upstream.start()
+    env = {
+        **os.environ,
+        "MOCK_SERVER_URL": f"http://127.0.0.1:{upstream_port}",
+        **dict(value.split("=", 1) for value in args.env),
+    }
+
+    loop = asyncio.get_running_loop()
+    samples: Dict[str, List[float]] = {"import_ms": []}
+    try:
+        for _ in range(args.runs):
+            samples["import_ms"].append(
+                await loop.run_in_executor(None, measure_import, env)
+            )
+            for name, value in (await measure_run(env, args.model_id)).items():
+                samples.setdefault(name, []).append(value)
+    finally:
+        await upstream.stop()
+
+    return {
+        "benchmark": "startup",
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "config": {
+            "runs": args.runs,
+            "model_id": args.model_id,
+            "env": args.env,
+        },
+        "results": {
+            name: summarize(values) for name, values in samples.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--model-id", default="GPT-3.5")
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="Environment variable for the gateway, can be repeated",
+    )
+    parser.add_argument("--output", help="Write the JSON report here")
+    args = parser.parse_args()
+
+    report = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
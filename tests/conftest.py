@@ -0,0 +1,17 @@
+import pytest
+
+from baseten_backend_take_home.negative_cache import negative_cache
+from baseten_backend_take_home.repositories import (
+    model_repository,
+    organization_repository,
+)
+
+
+@pytest.fixture(autouse=True)
+def empty_registry():
+    model_repository.restore({"next_id": 1, "models": []})
+    organization_repository.restore(
+        {"next_id": 1, "organizations": []}, model_repository
+    )
+    negative_cache.invalidate()
+    yield
@@ -0,0 +1,127 @@
+import asyncio
+
+import pytest
+from prometheus_client import REGISTRY
+
+from baseten_backend_take_home.dispatcher import PriorityDispatcher
+
+
+def queue_depth(lane: str) -> float:
+    return REGISTRY.get_sample_value(
+        "upstream_dispatch_queue_depth", {"lane": lane}
+    )
+
+
+def in_flight_metric(lane: str) -> float:
+    return REGISTRY.get_sample_value(
+        "upstream_dispatch_in_flight", {"lane": lane}
+    )
+
+
+async def start_acquire(dispatcher: PriorityDispatcher, priority: str):
+    """Queue an acquire and let the dispatcher process it"""
+    task = asyncio.create_task(dispatcher.acquire(priority))
+    await asyncio.sleep(0)
+    return task
+
+
+@pytest.mark.asyncio
+async def test_reserved_slots_only_serve_high():
+    dispatcher = PriorityDispatcher(capacity=3, reserved=1, aging=10)
+    low = [await start_acquire(dispatcher, "low") for _ in range(3)]
+    assert [task.done() for task in low] == [True, True, False]
+
+    high = await start_acquire(dispatcher, "high")
+    assert high.done()
+    assert dispatcher.in_flight == 3
+
+    # A freed shared slot goes to the queued low call
+    dispatcher.release("low")
+    await asyncio.sleep(0)
+    assert low[2].done()
+
+    for priority in ("low", "low", "high"):
+        dispatcher.release(priority)
+    assert dispatcher.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_high_goes_first_until_low_has_aged():
+    dispatcher = PriorityDispatcher(capacity=1, reserved=0, aging=0.05)
+    await dispatcher.acquire("high")
+
+    low = await start_acquire(dispatcher, "low")
+    high = await start_acquire(dispatcher, "high")
+    dispatcher.release("high")
+    await asyncio.sleep(0)
+    assert high.done() and not low.done()
+
+    # Once low has waited past the aging penalty it beats new high calls
+    await asyncio.sleep(0.06)
+    newer_high = await start_acquire(dispatcher, "high")
+    dispatcher.release("high")
+    await asyncio.sleep(0)
+    assert low.done() and not newer_high.done()
+
+    dispatcher.release("low")
+    await asyncio.sleep(0)
+    assert newer_high.done()
+    dispatcher.release("high")
+    assert dispatcher.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_cancel_while_queued_gives_up_place():
+    dispatcher = PriorityDispatcher(capacity=1, reserved=0, aging=10)
+    depth = queue_depth("low")
+    await dispatcher.acquire("high")
+
+    queued = await start_acquire(dispatcher, "low")
+    assert queue_depth("low") == depth + 1
+    queued.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await queued
+    assert queue_depth("low") == depth
+
+    dispatcher.release("high")
+    assert dispatcher.in_flight == 0
+    # The slot is free again, not held by the cancelled call
+    await asyncio.wait_for(dispatcher.acquire("low"), 1)
+    dispatcher.release("low")
+
+
+@pytest.mark.asyncio
+async def test_cancel_just_after_grant_releases_slot():
+    dispatcher = PriorityDispatcher(capacity=1, reserved=0, aging=10)
+    depth = queue_depth("low")
+    in_flight = in_flight_metric("low")
+    await dispatcher.acquire("high")
+
+    granted = await start_acquire(dispatcher, "low")
+    # Hand the slot over, then cancel before the waiter gets to run
+    dispatcher.release("high")
+    assert dispatcher.in_flight == 1
+    granted.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await granted
+
+    assert dispatcher.in_flight == 0
+    assert queue_depth("low") == depth
+    assert in_flight_metric("low") == in_flight
+
+
+@pytest.mark.asyncio
+async def test_queue_depth_tracks_waiting_calls():
+    dispatcher = PriorityDispatcher(capacity=1, reserved=0, aging=10)
+    depth = queue_depth("high")
+    await dispatcher.acquire("high")
+
+    waiting = [await start_acquire(dispatcher, "high") for _ in range(3)]
+    assert queue_depth("high") == depth + 3
+    for expected in (2, 1, 0):
+        dispatcher.release("high")
+        await asyncio.sleep(0)
+        assert queue_depth("high") == depth + expected
+    assert all(task.done() for task in waiting)
+    dispatcher.release("high")
+    assert dispatcher.in_flight == 0
@@ -0,0 +1,47 @@
+from fastapi.testclient import TestClient
+
+from baseten_backend_take_home.main import create_app
+from baseten_backend_take_home.negative_cache import negative_cache
+from baseten_backend_take_home.repositories import (
+    metrics_repository,
+    model_repository,
+)
+
+
+def invoke(client: TestClient, model_id: str) -> dict:
+    response = client.post(
+        "/invoke", json={"worklet_input": {"model_id": model_id, "input": [1]}}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def failed_invocations(model_id: str) -> int:
+    stats = metrics_repository.get_model_stats(model_id).get(model_id)
+    return stats.failed_invocations if stats else 0
+
+
+def test_negative_cache_hits_are_failures_in_stats():
+    model = model_repository.create("Cached-Model")
+    error_log = "Model Cached-Model does not exist"
+    negative_cache.remember(str(model.id), error_log)
+    client = TestClient(create_app(seed=False))
+
+    # Every way of naming the model hits the same entry, without upstream
+    for model_ref in ("Cached-Model", "cached-model", str(model.id)):
+        before = failed_invocations(model_ref)
+        body = invoke(client, model_ref)
+        assert body["success"] is False
+        assert body["error_log"] == error_log
+        assert failed_invocations(model_ref) == before + 1
+
+
+def test_rejected_invocations_are_failures_in_stats():
+    client = TestClient(create_app(seed=False))
+    before = failed_invocations("No-Such-Model")
+
+    body = invoke(client, "No-Such-Model")
+    assert body["error_log"] == "Model No-Such-Model does not exist"
+    assert failed_invocations("No-Such-Model") == before + 1
+    history = metrics_repository.get_invocation_history("No-Such-Model")
+    assert history[-1].latency_ms == 0
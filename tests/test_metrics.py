@@ -0,0 +1,37 @@
+from prometheus_client import REGISTRY
+
+from baseten_backend_take_home.prometheus_metrics import (
+    OTHER_MODEL_LABEL,
+    ModelLabelCache,
+)
+from baseten_backend_take_home.repositories import model_repository
+
+
+def model_info(model_id: str, name: str):
+    return REGISTRY.get_sample_value(
+        "model_info", {"model_id": model_id, "name": name}
+    )
+
+
+def test_labels_are_model_ids():
+    labels = ModelLabelCache()
+    model = model_repository.create("Label-Model")
+    namesake = model_repository.create("Label-Model")
+
+    children = labels.get("label-model")
+    assert children.label == str(model.id)
+    assert labels.get(str(model.id)) is children
+    assert labels.for_model(namesake).label == str(namesake.id)
+    assert labels.get("no-such-model").label == OTHER_MODEL_LABEL
+    assert model_info(str(model.id), "Label-Model") == 1
+
+
+def test_rename_keeps_label():
+    labels = ModelLabelCache()
+    model = model_repository.create("Before-Rename")
+    children = labels.for_model(model)
+
+    model_repository.update(model.id, "After-Rename")
+    assert labels.for_model(model) is children
+    assert model_info(str(model.id), "After-Rename") == 1
+    assert model_info(str(model.id), "Before-Rename") is None
@@ -0,0 +1,153 @@
+import asyncio
+import json
+
+import pytest
+
+from baseten_backend_take_home import graphql_schema, main
+from baseten_backend_take_home.graphql_schema import SCHEMA
+from baseten_backend_take_home.instrumentation import NULL_TRACE
+from baseten_backend_take_home.persistence import (
+    SnapshotReader,
+    StateSnapshotter,
+    write_snapshot,
+)
+from baseten_backend_take_home.repositories import (
+    model_repository,
+    seed_sample_data,
+)
+
+SNAPSHOT_MODELS = 2003
+
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    """A snapshot holding more models than the sample data"""
+    path = str(tmp_path / "state.snap")
+    write_snapshot(
+        path,
+        {
+            "models": {
+                "next_id": SNAPSHOT_MODELS + 1,
+                "models": [
+                    [model_id, f"m{model_id - 1}", False]
+                    for model_id in range(1, SNAPSHOT_MODELS + 1)
+                ],
+            },
+            "organizations": {
+                "next_id": 2,
+                "organizations": [["1", "snapshot-org", [1, 2], None]],
+            },
+            "negative_cache": [],
+        },
+    )
+    return path
+
+
+@pytest.fixture
+def snapshotter(snapshot_path, monkeypatch):
+    snapshotter = StateSnapshotter(snapshot_path, interval=3600)
+    monkeypatch.setattr(graphql_schema, "state_snapshotter", snapshotter)
+    monkeypatch.setattr(main, "state_snapshotter", snapshotter)
+    return snapshotter
+
+
+def snapshot_model_count(path: str) -> int:
+    reader = SnapshotReader(path)
+    try:
+        return len(reader.section("models")["models"])
+    finally:
+        reader.close()
+
+
+@pytest.mark.asyncio
+async def test_stop_before_hydration_keeps_snapshot(snapshotter):
+    seed_sample_data()
+    snapshotter.start()
+    await snapshotter.stop()
+
+    assert not snapshotter.hydrated.is_set()
+    assert snapshot_model_count(snapshotter.path) == SNAPSHOT_MODELS
+
+
+@pytest.mark.asyncio
+async def test_failed_hydration_keeps_snapshot(snapshotter):
+    with open(snapshotter.path, "wb") as f:
+        f.write(b"not a snapshot")
+    snapshotter.start()
+    await snapshotter.writable.wait()
+    await snapshotter.stop()
+
+    assert not snapshotter.hydrated.is_set()
+    with open(snapshotter.path, "rb") as f:
+        assert f.read() == b"not a snapshot"
+
+
+@pytest.mark.asyncio
+async def test_hydration_without_snapshot_saves(tmp_path):
+    snapshotter = StateSnapshotter(str(tmp_path / "new.snap"), interval=3600)
+    seed_sample_data()
+    snapshotter.start()
+    await snapshotter.writable.wait()
+    await snapshotter.stop()
+
+    assert snapshotter.hydrated.is_set()
+    assert snapshot_model_count(snapshotter.path) == 3
+
+
+@pytest.mark.asyncio
+async def test_mutation_during_hydration_waits(snapshotter):
+    snapshotter.start()
+    mutation = asyncio.create_task(
+        SCHEMA.execute('mutation { createModel(name: "new") { id } }')
+    )
+    await asyncio.sleep(0)
+    assert not snapshotter.writable.is_set()
+
+    result = await mutation
+    assert result.errors is None
+    assert snapshotter.hydrated.is_set()
+
+    # The new model got a fresh id and survived hydration
+    new_id = result.data["createModel"]["id"]
+    assert new_id == SNAPSHOT_MODELS + 1
+    assert model_repository.get_by_id(new_id).name == "new"
+    assert model_repository.get_by_id(4).name == "m3"
+    await snapshotter.stop()
+    assert snapshot_model_count(snapshotter.path) == SNAPSHOT_MODELS + 1
+
+
+class EchoEndpoint:
+    """Upstream stand-in answering every invocation successfully."""
+
+    async def exec(self, json_str: str):
+        worklet_input = json.loads(json_str)["worklet_input"]
+        data = {
+            "worklet_output": worklet_input["input"],
+            "success": True,
+            "latency_ms": 1,
+            "error_log": "",
+        }
+
+        class Response:
+            async def json(self):
+                return data
+
+        return Response()
+
+
+@pytest.mark.asyncio
+async def test_invoke_during_hydration_waits_for_snapshot_models(
+    snapshotter, monkeypatch
+):
+    monkeypatch.setattr(main, "MOCK_ENDPOINT", EchoEndpoint())
+    request = main.InvokeRequest(
+        worklet_input={"model_id": "m5", "input": [1, 2]}
+    )
+    snapshotter.start()
+    assert model_repository.get_by_name("m5") is None
+
+    response = await main._invoke_model(request, NULL_TRACE)
+    assert response.success is True
+    assert response.worklet_output == [1, 2]
+    assert snapshotter.hydrated.is_set()
+    await snapshotter.stop()
@@ -0,0 +1,48 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from baseten_backend_take_home.graphql_schema import SCHEMA
+from baseten_backend_take_home.models import normalize_priority
+from baseten_backend_take_home.repositories import organization_repository
+
+
+def test_normalize_priority():
+    assert normalize_priority(" HIGH ") == "high"
+    assert normalize_priority(None) is None
+    with pytest.raises(ValueError, match="X-Priority must be one of"):
+        normalize_priority("medium", "X-Priority")
+
+
+def test_invalid_default_priority_fails_import():
+    result = subprocess.run(
+        [sys.executable, "-c", "import baseten_backend_take_home.dispatcher"],
+        env={**os.environ, "DEFAULT_PRIORITY": "medium"},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode != 0
+    assert "DEFAULT_PRIORITY must be one of high, low" in result.stderr
+
+
+@pytest.mark.asyncio
+async def test_organization_priority_is_case_insensitive():
+    result = await SCHEMA.execute(
+        'mutation { createOrganization(name: "o", defaultPriority: "Low") '
+        "{ id defaultPriority } }"
+    )
+    assert result.errors is None
+    org = result.data["createOrganization"]
+    assert org["defaultPriority"] == "low"
+
+    result = await SCHEMA.execute(
+        "mutation($id: String!) "
+        '{ setOrganizationPriority(organizationId: $id, priority: "HIGH") }',
+        variable_values={"id": org["id"]},
+    )
+    assert result.errors is None
+    assert organization_repository.get_by_id(org["id"]).default_priority == (
+        "high"
+    )
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from baseten_backend_take_home.dispatcher import upstream_dispatcher
+from baseten_backend_take_home.sharding import invoke_sharded, split_input
+
+
+class FakeResponse:
+    def __init__(self, data: dict):
+        self._data = data
+
+    async def json(self) -> dict:
+        return self._data
+
+
+class FakeEndpoint:
+    """Doubles each shard's input, shards starting at fail_at fail."""
+
+    def __init__(self, fail_at=None, short_at=None, delays=None):
+        self.fail_at = fail_at
+        self.short_at = short_at
+        # First input value -> seconds to wait before answering
+        self.delays = delays or {}
+        self.cancelled = 0
+
+    async def exec(self, json_str: str) -> FakeResponse:
+        shard = json.loads(json_str)["worklet_input"]["input"]
+        try:
+            await asyncio.sleep(self.delays.get(shard[0], 0))
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if shard[0] == self.fail_at:
+            return FakeResponse(
+                {
+                    "worklet_output": [],
+                    "success": False,
+                    "latency_ms": 3,
+                    "error_log": f"shard {shard[0]} failed",
+                }
+            )
+        output = [value * 2 for value in shard]
+        if shard[0] == self.short_at:
+            output = output[:-1]
+        return FakeResponse(
+            {
+                "worklet_output": output,
+                "success": True,
+                "latency_ms": shard[0],
+                "error_log": "",
+            }
+        )
+
+
+def test_split_input():
+    assert split_input(list(range(5)), 2) == [[0, 1], [2, 3], [4]]
+
+
+@pytest.mark.asyncio
+async def test_outputs_reassembled_in_input_order():
+    # Later shards answer first
+    endpoint = FakeEndpoint(delays={0: 0.03, 4: 0.02, 8: 0.01})
+    result = await invoke_sharded(endpoint, "m", list(range(10)), 4)
+
+    assert result["success"] is True
+    assert result["worklet_output"] == [value * 2 for value in range(10)]
+    assert result["latency_ms"] == 8
+
+
+@pytest.mark.asyncio
+async def test_failed_shard_fails_invocation_and_cancels_siblings():
+    endpoint = FakeEndpoint(fail_at=4, delays={0: 10, 8: 10})
+    result = await asyncio.wait_for(
+        invoke_sharded(endpoint, "m", list(range(12)), 4), 1
+    )
+
+    assert result["success"] is False
+    assert result["worklet_output"] == []
+    assert result["error_log"] == "shard 4 failed"
+    assert result["latency_ms"] == 3
+    await asyncio.sleep(0)
+    assert endpoint.cancelled == 2
+    assert upstream_dispatcher.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_short_shard_output_fails_invocation():
+    endpoint = FakeEndpoint(short_at=4)
+    result = await invoke_sharded(endpoint, "m", list(range(8)), 4)
+
+    assert result["success"] is False
+    assert result["error_log"] == "Shard returned 3 outputs for 4 inputs"
+
+
+@pytest.mark.parametrize("name", ["SHARD_SIZE", "SHARD_MAX_CONCURRENCY"])
+def test_non_positive_settings_fail_import(name):
+    result = subprocess.run(
+        [sys.executable, "-c", "import baseten_backend_take_home.sharding"],
+        env={**os.environ, name: "0"},
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode != 0
+    assert f"{name} must be positive, got 0" in result.stderr